@@ -5,12 +5,12 @@ a = Analysis(
     ['launcher.py'],
     pathex=[],
     binaries=[],
-    datas=[('background.png', '.'), ('app_icon.ico', '.'), ('app_icon.png', '.')],
+    datas=[('background.png', '.'), ('app_icon.ico', '.'), ('app_icon.png', '.'), ('locales', 'locales')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['translations'],
     noarchive=False,
     optimize=0,
 )
@@ -2,6 +2,8 @@ import PyInstaller.__main__
 import os
 import sys
 
+import build_translations
+
 def build():
     print("Starting build process for Elden Ring Launcher...")
     
@@ -25,11 +27,15 @@ def build():
         print("Please run: pip install -r requirements.txt")
         return
 
+    # Per-language catalogs; the launcher loads only the active one
+    build_translations.build()
+
     # Assets to include
     assets = [
         ('background.png', '.'),
         ('app_icon.ico', '.'),
-        ('app_icon.png', '.')
+        ('app_icon.png', '.'),
+        ('locales', 'locales')
     ]
 
     params = [
@@ -39,6 +45,7 @@ def build():
         '--name=ER_Launcher',
         '--icon=app_icon.ico',
         '--clean',
+        '--exclude-module=translations', # Replaced by the locales catalogs
     ]
 
     for src, dest in assets:
@@ -0,0 +1,34 @@
+"""Split translations.py into per-language JSON catalogs for the launcher.
+
+Writes locales/<code>.json for every language, each one a flat dict with
+the English strings merged in as fallback, plus locales/languages.json
+with LANGUAGES_LIST. The launcher loads only the active language's file
+(and falls back to importing translations.py when they are missing or
+older than it). build_exe.py runs this before bundling.
+"""
+import json
+import os
+
+from translations import TRANSLATIONS, LANGUAGES_LIST
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def build():
+    os.makedirs(LOCALES_DIR, exist_ok=True)
+    english = TRANSLATIONS["en"]
+    for code, strings in TRANSLATIONS.items():
+        write_json(os.path.join(LOCALES_DIR, f"{code}.json"), {**english, **strings})
+    write_json(os.path.join(LOCALES_DIR, "languages.json"), [list(entry) for entry in LANGUAGES_LIST])
+    print(f"Wrote {len(TRANSLATIONS)} catalogs to {LOCALES_DIR}")
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,36 @@
+import importlib.util
+import os
+
+import pytest
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+SERVER_ENV = ("ER_USER_STORE", "ER_SERVER_WORKERS", "ER_SERVER_ROLE", "ER_WORKER_INDEX",
+              "ER_CHAT_JOURNAL_COMPACT_LINES", "ER_METRICS_PORT", "ER_METRICS_DUMP_INTERVAL")
+
+
+@pytest.fixture
+def load_server(tmp_path, monkeypatch):
+    """Import a fresh copy of server.py (as if the server started) with its data in tmp_path.
+
+    Keyword arguments are set as environment variables first. Calling it
+    again with the same directory simulates a restart.
+    """
+    loaded = []
+
+    def load(**env):
+        for key in SERVER_ENV:
+            monkeypatch.delenv(key, raising=False)
+        monkeypatch.setenv("ER_SERVER_DATA_DIR", str(tmp_path))
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        spec = importlib.util.spec_from_file_location("er_server_under_test", SERVER_SCRIPT)
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        loaded.append(server)
+        return server
+
+    yield load
+    for server in loaded:
+        server._close_chat_journal()
+        if server.USER_DB is not None:
+            server.USER_DB.close()
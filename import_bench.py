@@ -0,0 +1,78 @@
+"""Import-time benchmark for the launcher's lazily loaded subsystems.
+
+launcher.py imports only what the first frame needs (the "ui" group) at
+startup; the other groups are imported on first use. This measures each
+group in fresh interpreters, both on its own and on top of the ui group
+(the cost actually paid when the subsystem is first used), so regressions
+in startup or first-use time show up.
+
+Example:
+    python import_bench.py --runs 7 --json import_bench.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SUBSYSTEMS = {
+    "ui": ["customtkinter", "PIL.Image"],
+    "chat": ["asyncio", "websockets", "websockets.extensions.permessage_deflate"],
+    "downloads": ["urllib.request", "zipfile", "py7zr"],
+    "discovery": ["winreg", "re"],
+    "process_watcher": ["psutil"],
+    "system": ["ctypes", "webbrowser"],
+    "translations_module": ["translations"],
+}
+
+SNIPPET = """
+import importlib, sys, time
+for name in {preload!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+missing = []
+started = time.perf_counter()
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        missing.append(name)
+print(time.perf_counter() - started, ",".join(missing))
+"""
+
+
+def measure(modules, preload, runs):
+    """Median import time in ms over `runs` fresh interpreters, plus modules that aren't installed."""
+    times = []
+    missing = ""
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", SNIPPET.format(modules=modules, preload=preload)],
+                             capture_output=True, text=True, check=True).stdout.split(" ", 1)
+        times.append(float(out[0]) * 1000)
+        missing = out[1].strip() if len(out) > 1 else ""
+    return round(statistics.median(times), 1), missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time per launcher subsystem.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement (median is reported)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'subsystem':<20} {'alone ms':>9} {'after ui ms':>12}  missing")
+    for name, modules in SUBSYSTEMS.items():
+        alone, missing = measure(modules, [], args.runs)
+        after_ui = alone if name == "ui" else measure(modules, SUBSYSTEMS["ui"], args.runs)[0]
+        results[name] = {"modules": modules, "alone_ms": alone, "after_ui_ms": after_ui, "missing": missing.split(",") if missing else []}
+        print(f"{name:<20} {alone:>9.1f} {after_ui:>12.1f}  {missing}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,30 @@
-import os
 import time
-import webbrowser
+STARTUP_T0 = time.perf_counter() # --profile-startup measures from here
+import sys
+if "--profile-startup=cprofile" in sys.argv:
+    import cProfile
+    STARTUP_CPROFILE = cProfile.Profile()
+    STARTUP_CPROFILE.enable() # Started before the imports so they show up too
+else:
+    STARTUP_CPROFILE = None
+import os
 import uuid
 from datetime import datetime
 import shutil
-import sys
 import subprocess
 import configparser
+import atexit
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox
 import json
 import threading
-import urllib.request
-import zipfile
-import io
-import ctypes
-import struct
-import asyncio
-import websockets
 import queue
-from PIL import Image, ImageFilter, ImageEnhance, ImageDraw
-from translations import TRANSLATIONS, LANGUAGES_LIST
+from collections import deque
+from PIL import Image
+# Subsystems that aren't needed for the first frame import their modules on first use:
+# chat (asyncio, websockets), downloads (urllib.request, zipfile, py7zr), discovery
+# (winreg), admin checks (ctypes) and links (webbrowser). import_bench.py tracks their cost.
 
 
 
@@ -35,9 +38,159 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- Startup profiling ---
+class StartupProfiler:
+    """Wall time per startup phase for --profile-startup.
+
+    mark(phase) records a main-thread phase as the time since the previous
+    mark; record(phase, duration) records a phase that runs on its own
+    thread (see run_then_mark), so overlapping checks don't eat into each
+    other or into the main-thread phases. Only the first entry of each
+    phase counts, as setup_ui also runs on rebuilds. Once all
+    `expected` phases are in, or after finish(), the report is printed and
+    appended as a JSON line to startup_profile.jsonl in the config folder;
+    with --profile-startup=cprofile a startup_profile.prof is written too
+    (open with `python -m pstats` or snakeviz).
+    """
+    def __init__(self, t0, cprofile=None, expected=()):
+        self.t0 = t0
+        self.last = t0
+        self.cprofile = cprofile
+        self.expected = set(expected)
+        self.phases = []
+        self.out_dir = None
+        self.call_in_ui = None # Runs finish() on the Tk thread, where cProfile was enabled
+        self.done = False
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        with self._lock:
+            delta = now - self.last
+            self.last = now
+        self.record(phase, delta, now)
+
+    def record(self, phase, duration, end=None):
+        if end is None:
+            end = time.perf_counter()
+        with self._lock:
+            if self.done or any(name == phase for name, _, _ in self.phases):
+                return
+            self.phases.append((phase, duration, end - self.t0))
+            finished = self.expected.issubset(name for name, _, _ in self.phases)
+        if finished:
+            if self.call_in_ui and threading.current_thread() is not threading.main_thread():
+                self.call_in_ui(self.finish)
+            else:
+                self.finish()
+
+    def finish(self):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+        if self.cprofile:
+            self.cprofile.disable()
+        self.phases.sort(key=lambda entry: entry[2])
+        lines = [f"Startup profile ({len(self.phases)} phases):"]
+        for phase, delta, total in self.phases:
+            lines.append(f"  {phase:<16} {delta * 1000:8.1f} ms   (at {total * 1000:8.1f} ms)")
+        print("\n".join(lines))
+        if not self.out_dir:
+            return
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "version": EldenRingLauncher.VERSION,
+            "frozen": bool(getattr(sys, 'frozen', False)),
+            "phases_ms": {phase: round(delta * 1000, 1) for phase, delta, _ in self.phases},
+            "total_ms": round(max(total for _, _, total in self.phases) * 1000, 1) if self.phases else 0,
+        }
+        try:
+            with open(os.path.join(self.out_dir, "startup_profile.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            if self.cprofile:
+                self.cprofile.dump_stats(os.path.join(self.out_dir, "startup_profile.prof"))
+            print(f"Startup profile written to {self.out_dir}")
+        except OSError as e:
+            print(f"Failed to write startup profile: {e}")
+
+STARTUP_PROFILER = None
+if STARTUP_CPROFILE or "--profile-startup" in sys.argv:
+    STARTUP_PROFILER = StartupProfiler(STARTUP_T0, STARTUP_CPROFILE,
+                                       expected=("fade in", "version check", "modpack check"))
+
+def profile_mark(phase):
+    if STARTUP_PROFILER:
+        STARTUP_PROFILER.mark(phase)
+
+def run_then_mark(func, phase=None):
+    """Thread target that runs func and records its own duration as a startup phase."""
+    if phase is None:
+        return func
+    def run():
+        started = time.perf_counter()
+        try:
+            func()
+        finally:
+            if STARTUP_PROFILER:
+                STARTUP_PROFILER.record(phase, time.perf_counter() - started)
+    return run
+
+def open_url(url):
+    import webbrowser
+    webbrowser.open(url)
+
+# --- Translations ---
+# Per-language catalogs from build_translations.py (locales/<code>.json, English merged
+# in as fallback), loaded on first use. Running from source without them, or with
+# catalogs older than translations.py, falls back to importing translations.py.
+LOCALES_DIR = resource_path("locales")
+TRANSLATIONS_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations.py")
+_CATALOGS = {}
+
+def _locale_file(name):
+    path = os.path.join(LOCALES_DIR, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        if not getattr(sys, 'frozen', False) and os.path.exists(TRANSLATIONS_SOURCE) and \
+           os.path.getmtime(TRANSLATIONS_SOURCE) > os.path.getmtime(path):
+            return None # Stale: translations.py was edited after the catalogs were built
+        return path
+    except OSError:
+        return None
+
+def load_languages_list():
+    path = _locale_file("languages.json")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [tuple(entry) for entry in json.load(f)]
+    from translations import LANGUAGES_LIST
+    return LANGUAGES_LIST
+
+def load_catalog(lang):
+    """Flat key -> string dict for `lang` (English for unknown languages and missing keys)."""
+    catalog = _CATALOGS.get(lang)
+    if catalog is None:
+        path = _locale_file(f"{lang}.json")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                catalog = json.load(f)
+        elif _locale_file("en.json"):
+            return load_catalog("en") # Unknown language
+        else:
+            from translations import TRANSLATIONS
+            if lang not in TRANSLATIONS:
+                return load_catalog("en")
+            catalog = {**TRANSLATIONS["en"], **TRANSLATIONS[lang]}
+        _CATALOGS.clear() # Keep only the active language
+        _CATALOGS[lang] = catalog
+    return catalog
+
 def is_admin():
     """Detect if the script is running with administrative privileges."""
     try:
+        import ctypes
         return ctypes.windll.shell32.IsUserAnAdmin()
     except:
         return False
@@ -54,19 +207,276 @@ def run_as_admin():
         params = f'"{os.path.abspath(sys.argv[0])}" ' + ' '.join([f'"{arg}"' for arg in sys.argv[1:]])
     
     try:
+        import ctypes
         ctypes.windll.shell32.ShellExecuteW(None, "runas", executable, params, None, 1)
         sys.exit(0)
     except Exception as e:
         print(f"Elevation failed: {e}")
         return False
 
+# Chat protocol: short keys the server uses once we announce the "compact" capability
+# (mirrors COMPACT_KEYS in server.py). Messages with full keys pass through unchanged.
+CHAT_SHORT_KEYS = {
+    "t": "type", "n": "nickname", "m": "message", "ms": "messages", "tm": "time",
+    "c": "color", "tc": "tripcode", "pl": "players", "p": "player", "s": "seq",
+    "i": "id", "mp": "modpack", "ig": "in_game", "gm": "game_mode", "pt": "playtime",
+    "pts": "playtime_seconds", "ct": "count", "lb": "lobbies", "pw": "password", "e": "entries",
+}
+
+def expand_chat_keys(data):
+    if isinstance(data, dict):
+        return {CHAT_SHORT_KEYS.get(key, key): expand_chat_keys(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [expand_chat_keys(value) for value in data]
+    return data
+
+class ChatSendQueue:
+    """Hands outgoing chat frames from the UI thread to the chat loop's asyncio.Queue.
+
+    put() wakes the loop through call_soon_threadsafe, so frames go out
+    immediately and an idle connection costs nothing. Frames put while no
+    loop is attached are kept and sent once one is.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._pending = []
+
+    def attach(self, loop):
+        """Bind to the running loop; must be called from inside it."""
+        import asyncio
+        with self._lock:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            for payload in self._pending:
+                self._queue.put_nowait(payload)
+            self._pending.clear()
+
+    def detach(self):
+        with self._lock:
+            self._loop = None
+            self._queue = None
+
+    def put(self, payload):
+        with self._lock:
+            if self._loop is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
+                    return
+                except RuntimeError:
+                    pass # Loop already closed
+            self._pending.append(payload)
+
+    async def get(self):
+        return await self._queue.get()
+
+class ConfigStore:
+    """launcher_config.ini kept in memory.
+
+    The file is read once. set() updates memory and schedules a write
+    `delay` seconds later, so a burst of changes is written once. Writes
+    go to a temp file that replaces the config atomically (os.replace).
+    """
+    def __init__(self, path, section="Main", delay=0.5):
+        self.path = path
+        self.section = section
+        self.delay = delay
+        self.parser = configparser.ConfigParser()
+        self._lock = threading.Lock()
+        self._timer = None
+        try:
+            if os.path.exists(path):
+                self.parser.read(path)
+        except configparser.Error as e:
+            print(f"Failed to read config {path}: {e}")
+        if not self.parser.has_section(section):
+            self.parser.add_section(section)
+        atexit.register(self.flush)
+
+    def get(self, key, fallback=None):
+        with self._lock:
+            return self.parser.get(self.section, key, fallback=fallback)
+
+    def set(self, key, value):
+        with self._lock:
+            self.parser.set(self.section, key, value)
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    self.parser.write(f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Failed to save config: {e}")
+
+class BackgroundImageCache:
+    """background.png decoded once, with a pre-resized variant per UI scaling.
+
+    Each variant is already at the pixel size CTkImage will ask for, so its
+    own resize is a plain copy, and the CTkImage is reused across UI
+    rebuilds (it keeps its PhotoImages). Variants are also stored in
+    `cache_dir` (uncompressed, keyed by a hash of the source's content, as
+    the one-file EXE extracts it with a new mtime on every launch), so
+    later starts skip decoding and resizing the full-size PNG. Variants of
+    an older background are deleted when a new one is written.
+    """
+    def __init__(self, source_path, cache_dir, size=(1000, 550)):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.size = size
+        self._source = None
+        self._variants = {}
+        self._ctk_images = {}
+        self._source_key = None
+
+    def _pixel_size(self, scaling):
+        return (round(self.size[0] * scaling), round(self.size[1] * scaling))
+
+    def _key(self):
+        if self._source_key is None:
+            import hashlib
+            with open(self.source_path, "rb") as f:
+                self._source_key = hashlib.sha1(f.read()).hexdigest()[:16]
+        return self._source_key
+
+    def _disk_path(self, pixel_size):
+        name = f"background_{self._key()}_{pixel_size[0]}x{pixel_size[1]}.bmp"
+        return os.path.join(self.cache_dir, name)
+
+    def variant(self, scaling):
+        """PIL image of the background at the pixel size for `scaling`."""
+        pixel_size = self._pixel_size(scaling)
+        image = self._variants.get(pixel_size)
+        if image is not None:
+            return image
+        disk_path = self._disk_path(pixel_size)
+        if os.path.exists(disk_path):
+            try:
+                image = Image.open(disk_path)
+                image.load()
+            except OSError:
+                image = None
+        if image is None:
+            if self._source is None:
+                self._source = Image.open(self.source_path)
+                self._source.load()
+            image = self._source.resize(pixel_size, Image.LANCZOS)
+            threading.Thread(target=self._save, args=(image, disk_path), daemon=True).start()
+        self._variants[pixel_size] = image
+        return image
+
+    def _save(self, image, disk_path):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = disk_path + ".tmp"
+            image.save(tmp_path, format="BMP") # Uncompressed: loads ~20x faster than PNG
+            os.replace(tmp_path, disk_path)
+            current = f"background_{self._key()}_"
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("background_") and not name.startswith(current):
+                    os.remove(os.path.join(self.cache_dir, name))
+        except OSError as e:
+            print(f"Failed to cache background image: {e}")
+
+    def ctk_image(self, scaling):
+        """CTkImage for the background, shared by every UI rebuild at this scaling."""
+        scaling = round(scaling, 2)
+        if scaling not in self._ctk_images:
+            image = self.variant(scaling)
+            self._ctk_images[scaling] = ctk.CTkImage(light_image=image, dark_image=image, size=self.size)
+        return self._ctk_images[scaling]
+
+class GameProcessWatcher:
+    """Tracks the game process without scanning every process on each check.
+
+    Once found, only that process is checked for liveness. The full
+    process scan runs at most every `scan_interval` seconds, or on every
+    poll for a while after expect_start() (a launch from the launcher).
+    Subscribers are called with True/False when the game starts or stops.
+    """
+    def __init__(self, exe_name="eldenring.exe", scan_interval=15, launch_window=30):
+        self.exe_name = exe_name
+        self.scan_interval = scan_interval
+        self.launch_window = launch_window
+        self.running = False
+        self._process = None
+        self._last_scan = 0
+        self._expect_until = 0
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def expect_start(self):
+        """Scan on every poll until the game shows up or the launch window passes."""
+        self._expect_until = time.monotonic() + self.launch_window
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def poll(self, force_scan=False):
+        """Update and return whether the game is running."""
+        import psutil
+        if self._process is not None:
+            try:
+                alive = self._process.is_running() and self._process.status() != psutil.STATUS_ZOMBIE
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                alive = False
+            if not alive:
+                self._process = None
+        now = time.monotonic()
+        if self._process is None and (force_scan or now < self._expect_until or now - self._last_scan >= self.scan_interval):
+            self._last_scan = now
+            self._process = self._scan(psutil)
+            if self._process is not None:
+                self._expect_until = 0
+        self._set_running(self._process is not None)
+        return self.running
+
+    def _scan(self, psutil):
+        for proc in psutil.process_iter(['name']):
+            try:
+                if (proc.info['name'] or "").lower() == self.exe_name:
+                    return proc
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        return None
+
+    def _set_running(self, running):
+        if running == self.running:
+            return
+        self.running = running
+        for callback in self._subscribers:
+            try:
+                callback(running)
+            except Exception as e:
+                print(f"[ERROR] Game state subscriber failed: {e}")
+
 class EldenRingLauncher(ctk.CTk):
     VERSION = "1.1.2"
     VERSION_URL = "https://raw.githubusercontent.com/conan513/er_launcher/master/version.txt"
     UPDATE_URL = "https://github.com/conan513/er_launcher/releases/download/v1/ER_Launcher.exe"
     MODPACK_VERSION_URL = "https://raw.githubusercontent.com/conan513/er_launcher/master/modpack.txt"
+    CHAT_UI_FRAME_BUDGET = 0.012 # Seconds of chat rendering per Tk frame before yielding
+    CHAT_UI_SAFETY_POLL_MS = 1000 # Fallback in case a wake-up event was lost
+    CHAT_MAX_MESSAGES = 300 # Older chat lines are trimmed from the view
+    LOBBY_ROW_POOL_SIZE = 8 # Hidden lobby rows kept for reuse instead of destroyed
 
     def __init__(self):
+        profile_mark("imports")
         super().__init__()
 
         self.title("Elden Ring Launcher")
@@ -99,6 +509,11 @@ class EldenRingLauncher(ctk.CTk):
                 print(f"Migrated config from {old_config_path} to {self.config_path}")
             except Exception as e:
                 print(f"Failed to migrate config: {e}")
+        self.config_store = ConfigStore(self.config_path)
+        if STARTUP_PROFILER:
+            STARTUP_PROFILER.out_dir = self.config_dir
+            STARTUP_PROFILER.call_in_ui = lambda func: self.after(0, func)
+            self.after(30000, STARTUP_PROFILER.finish) # Report whatever finished by then
         
         self.found_paths_set = set()
         self.bootstrap_debug_log = []
@@ -151,7 +566,12 @@ class EldenRingLauncher(ctk.CTk):
         self.bind("<FocusIn>", self.on_focus_in)
         self.bind("<FocusOut>", self.on_focus_out)
         
+        self.game_watcher = GameProcessWatcher()
+        self.game_watcher.subscribe(self.on_game_state_change)
         self.chat_queue = queue.Queue()
+        self._chat_backlog = [] # Events left over when a frame ran out of budget
+        self._chat_wake_pending = False
+        self.bind("<<ChatEvents>>", lambda e: self.receive_chat_messages())
         self.chat_socket = None
         self.chat_thread = None
         self.last_send_time = 0 # Anti-spam
@@ -191,8 +611,11 @@ class EldenRingLauncher(ctk.CTk):
         # self.check_for_updates()
         # self.check_for_modpack_updates()
 
+        profile_mark("config")
+
         # Check for administrative privileges if game is in Program Files (Proactive)
         self.check_admin_status()
+        profile_mark("admin check")
 
         # UI Setup (Base)
         self.lockdown_frame = None
@@ -243,23 +666,16 @@ class EldenRingLauncher(ctk.CTk):
         self.focus_force() # Force focus
 
     def load_config(self):
-        self.launcher_config = configparser.ConfigParser()
-        if os.path.exists(self.config_path):
-            self.launcher_config.read(self.config_path)
-            path = self.launcher_config.get('Main', 'game_path', fallback=None)
-            if path and os.path.exists(path):
-                self.game_dir = path
+        path = self.config_store.get('game_path')
+        if path and os.path.exists(path):
+            self.game_dir = path
         
         if self.game_dir:
             self.update_paths(self.game_dir)
             self.check_for_modpack_updates() # Re-check updates on path change
 
     def save_config(self, path):
-        if not self.launcher_config.has_section('Main'):
-            self.launcher_config.add_section('Main')
-        self.launcher_config.set('Main', 'game_path', path)
-        with open(self.config_path, 'w') as f:
-            self.launcher_config.write(f)
+        self.config_store.set('game_path', path)
         self.game_dir = path
         self.update_paths(path)
         self.refresh_launch_buttons() # Refresh buttons after path change
@@ -405,9 +821,8 @@ class EldenRingLauncher(ctk.CTk):
 
 
     def _t(self, key):
-        lang = self.lang_var.get()
-        # Fallback to English if key missing in translation
-        return TRANSLATIONS.get(lang, TRANSLATIONS["en"]).get(key, TRANSLATIONS["en"].get(key, key))
+        # Catalogs already contain the English fallback
+        return load_catalog(self.lang_var.get()).get(key, key)
 
     def on_lang_change(self, value):
         # Save current tab key before refreshing
@@ -420,7 +835,7 @@ class EldenRingLauncher(ctk.CTk):
 
         # Find code from display name
         lang_code = "en"
-        for code, name in LANGUAGES_LIST:
+        for code, name in load_languages_list():
             if name == value:
                 lang_code = code
                 break
@@ -445,8 +860,13 @@ class EldenRingLauncher(ctk.CTk):
         # Background Image
         self.bg_image_path = resource_path("background.png")
         if os.path.exists(self.bg_image_path):
-            bg_pil = Image.open(self.bg_image_path)
-            self.bg_image = ctk.CTkImage(light_image=bg_pil, dark_image=bg_pil, size=(1000, 550))
+            if not hasattr(self, 'bg_cache'):
+                self.bg_cache = BackgroundImageCache(self.bg_image_path, os.path.join(self.config_dir, "cache"))
+            try:
+                scaling = self._get_widget_scaling() # ctk scaling including the monitor DPI
+            except Exception:
+                scaling = 1.0
+            self.bg_image = self.bg_cache.ctk_image(scaling)
             self.bg_label = ctk.CTkLabel(self, image=self.bg_image, text="")
             self.bg_label.place(x=0, y=0, relwidth=1, relheight=1)
 
@@ -466,7 +886,9 @@ class EldenRingLauncher(ctk.CTk):
             self.add_language_selector(self)
             
         # Ensure window is visible and fades in
+        profile_mark("ui build")
         self.update() # Force update to map window
+        profile_mark("first paint")
         self.fade_in()
 
     def show_setup_view(self):
@@ -782,6 +1204,7 @@ class EldenRingLauncher(ctk.CTk):
             self.after(0, lambda: self.bootstrap_label.configure(text=text))
 
     def run_bootstrap(self, path):
+        import zipfile
         url = "https://github.com/conan513/er_launcher/releases/download/v1/spp_er.zip"
         temp_zip = os.path.join(path, "spp_er_temp.zip")
         # Pre-cleanup
@@ -1270,7 +1693,7 @@ class EldenRingLauncher(ctk.CTk):
         self.save_config_value("qol_fps_limit", str(fps_value))
         
         # Update FPS config.ini if game is not running
-        if self.game_dir and not self.is_game_running():
+        if self.game_dir and not self.is_game_running(fresh=True):
             self.update_fps_config_ini(fps_value)
 
 
@@ -1287,7 +1710,7 @@ class EldenRingLauncher(ctk.CTk):
             self.toggle_sharpening_file()
         
         # Update TOML and INI configs if game is not running
-        if self.game_dir and not self.is_game_running():
+        if self.game_dir and not self.is_game_running(fresh=True):
             self.update_toml_config(self.game_dir, "Quality of Life")
             
             # Update FPS config.ini if FPS Unlocker is enabled
@@ -1386,7 +1809,7 @@ class EldenRingLauncher(ctk.CTk):
             filename = os.path.basename(file_path)
             message = self._t("config_missing_warning").format(file=filename)
             from tkinter import messagebox
-            messagebox.showwarning(self._t("warning") if TRANSLATIONS[self.lang_var.get()].get("warning") else "Warning", message)
+            messagebox.showwarning(load_catalog(self.lang_var.get()).get("warning", "Warning"), message)
             print(f"Safety Check Failed: {file_path} is missing.")
             return False
         return True
@@ -1398,14 +1821,15 @@ class EldenRingLauncher(ctk.CTk):
         else:
              lang_frame.pack(pady=5)
         
+        languages = load_languages_list()
         current_display = "English"
-        for code, name in LANGUAGES_LIST:
+        for code, name in languages:
             if code == self.lang_var.get():
                 current_display = name
                 break
                 
         lang_menu = ctk.CTkComboBox(lang_frame, 
-                                     values=[n for c, n in LANGUAGES_LIST],
+                                     values=[n for c, n in languages],
                                      command=self.on_lang_change,
                                      width=150, height=28,
                                      font=("Arial", 11),
@@ -1488,8 +1912,11 @@ class EldenRingLauncher(ctk.CTk):
         # Reset color tags state since we are creating a fresh text widget
         if hasattr(self, 'created_color_tags'):
             del self.created_color_tags
+        self.chat_view_lines = deque() # (history key or None, text lines) per displayed message
         if hasattr(self, 'plist_tags'):
             del self.plist_tags
+        self.plist_rows = [] # (player key, row segments) per displayed line
+        self.plist_status_cache = {} # Translated status text, rebuilt with the UI language
             
         # Top Frame for Nickname & Status (Side-by-side for space)
         header_frame = ctk.CTkFrame(parent, fg_color="transparent")
@@ -1660,19 +2087,19 @@ class EldenRingLauncher(ctk.CTk):
 
         # Discord
         ctk.CTkButton(btns_container, text=f"💬 {self._t('about_discord')}", 
-                      command=lambda: webbrowser.open("https://discord.gg/wYyXVTS9bz"),
+                      command=lambda: open_url("https://discord.gg/wYyXVTS9bz"),
                       fg_color="#5865F2", hover_color="#4752C4", width=180, height=38,
                       font=("Arial", 11, "bold")).pack(pady=8)
 
         # Patreon
         ctk.CTkButton(btns_container, text=f"❤️ {self._t('about_patreon')}", 
-                      command=lambda: webbrowser.open("https://www.patreon.com/conan513"),
+                      command=lambda: open_url("https://www.patreon.com/conan513"),
                       fg_color="#F96854", hover_color="#E05B48", width=180, height=38,
                       font=("Arial", 11, "bold")).pack(pady=8)
 
         # PayPal
         ctk.CTkButton(btns_container, text=f"💸 {self._t('about_paypal')}", 
-                      command=lambda: webbrowser.open("https://www.paypal.com/donate/?hosted_button_id=3J7L23CSNBVUG"),
+                      command=lambda: open_url("https://www.paypal.com/donate/?hosted_button_id=3J7L23CSNBVUG"),
                       fg_color="#003087", hover_color="#00256B", width=180, height=38,
                       font=("Arial", 11, "bold")).pack(pady=8)
 
@@ -1800,22 +2227,33 @@ class EldenRingLauncher(ctk.CTk):
 
     def chat_loop(self):
         """Background loop to handle WebSocket communication."""
-        self.send_queue = queue.Queue()
+        # Imported here, on the chat thread, so they don't delay the first frame
+        import asyncio
+        import websockets
+        if not hasattr(self, 'send_queue'):
+            self.send_queue = ChatSendQueue()
 
         async def run():
+            self.send_queue.attach(asyncio.get_running_loop())
             uri = "ws://94.72.100.43:8765" # Public server
             try:
                 async with websockets.connect(uri) as websocket:
                     self.chat_socket = websocket
-                    self.chat_queue.put({"type": "status", "connected": True})
+                    # Announce protocol capabilities (ignored by older servers)
+                    await websocket.send(json.dumps({"type": "hello", "caps": ["roster_delta", "batch", "compact"]}))
+                    self.post_chat_events({"type": "status", "connected": True})
                     
                     # Create tasks for receiving and sending
                     async def receive():
                         try:
                             async for message in websocket:
                                 try:
-                                    data = json.loads(message)
-                                    self.chat_queue.put(data)
+                                    data = expand_chat_keys(json.loads(message))
+                                    if data.get("type") == "batch":
+                                        # Coalesced server update: queue the parts in order
+                                        self.post_chat_events(*data.get("messages", []))
+                                    else:
+                                        self.post_chat_events(data)
                                 except json.JSONDecodeError:
                                     pass
                         except Exception as e:
@@ -1823,25 +2261,25 @@ class EldenRingLauncher(ctk.CTk):
                     
                     async def send():
                         while True:
+                            payload = await self.send_queue.get()
                             try:
-                                while not self.send_queue.empty():
-                                    payload = self.send_queue.get_nowait()
-                                    await websocket.send(payload)
-                            except queue.Empty:
-                                pass
+                                await websocket.send(payload)
                             except Exception as e:
                                 print(f"Send error: {e}")
                                 break # Exit send loop if connection lost
-                            await asyncio.sleep(0.1)
                     
                     # Wait for either to finish (usually receive finishes when socket closes)
-                    await asyncio.gather(receive(), send())
+                    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in tasks:
+                        task.cancel()
                     
             except Exception as e:
                 print(f"Chat connection error: {e}")
             finally:
+                self.send_queue.detach()
                 self.chat_socket = None
-                self.chat_queue.put({"type": "status", "connected": False})
+                self.post_chat_events({"type": "status", "connected": False})
 
         asyncio.run(run())
 
@@ -1869,7 +2307,7 @@ class EldenRingLauncher(ctk.CTk):
             return
         
         if not nick:
-            messagebox.showwarning(self._t("warning") if TRANSLATIONS[self.lang_var.get()].get("warning") else "Warning", 
+            messagebox.showwarning(load_catalog(self.lang_var.get()).get("warning", "Warning"), 
                                    self._t("chat_nick_required"))
             return
 
@@ -1889,7 +2327,7 @@ class EldenRingLauncher(ctk.CTk):
                 "user_id": self.chat_user_id
             }, ensure_ascii=False)
             if not hasattr(self, 'send_queue'):
-                self.send_queue = queue.Queue()
+                self.send_queue = ChatSendQueue()
             self.send_queue.put(payload)
             self.last_send_time = now # Update cooldown
             self.chat_input.delete(0, 'end')
@@ -1911,159 +2349,330 @@ class EldenRingLauncher(ctk.CTk):
         except:
             pass
 
-    def render_player_list(self, players):
-        if hasattr(self, 'player_list_box') and self.player_list_box.winfo_exists():
-            self.player_list_box.configure(state="normal")
-            self.player_list_box.delete("1.0", "end")
-            for p in players:
-                nick = p.get("nickname", "Unknown")
-                mod = p.get("modpack", "Vanilla")
-                in_game = p.get("in_game", False)
-                mode = p.get("game_mode", "Online")
-                color = p.get("color", "gray")
-                
-                # Use a clean tag name for color
-                clean_color = color.replace("#", "")
-                tag_name = f"plist_{clean_color}"
-                
-                if not hasattr(self, 'plist_tags'):
-                    self.plist_tags = set()
-                
-                if tag_name not in self.plist_tags:
-                    self.player_list_box.tag_config(tag_name, foreground=color)
-                    self.plist_tags.add(tag_name)
-                
-                # Configure a subtle tag for tripcodes if not exists
-                if "tripcode_tag" not in self.plist_tags:
-                    self.player_list_box.tag_config("tripcode_tag", foreground="#888888") # Muted gray
-                    self.plist_tags.add("tripcode_tag")
-                
-                # Status Text (Compact Format)
-                if in_game:
-                    # Abbreviate mod names
-                    short_mod = mod
-                    if mod == "Quality of Life": short_mod = "QoL"
-                    elif mod == "Diablo Loot (RNG)": short_mod = "Diablo"
-                    
-                    mode_key = "mode_seamless" if mode == "Seamless" else "mode_online"
-                    info_text = f" ({short_mod} - {self._t(mode_key)})"
-                else:
-                    status_text = self._t("status_launcher")
-                    info_text = f" [{status_text}]"
-                
-                self.player_list_box.insert("end", f"• {nick}", tag_name)
-                
-                # Add tripcode if available
-                trip = p.get("tripcode", "")
-                if trip:
-                    self.player_list_box.insert("end", f" #{trip}", "tripcode_tag")
+    def on_player_list(self, data):
+        """Replace the local roster with a full snapshot from the server."""
+        players = data.get("players", [])
+        self.roster = {p.get("id", i): p for i, p in enumerate(players)}
+        self.roster_seq = data.get("seq") # None from servers without roster deltas
+        self._roster_resync_pending = False
+        self._player_list_dirty = True
+
+    def apply_player_delta(self, data):
+        """Apply a player_join/player_update/player_leave delta to the local roster."""
+        seq = data.get("seq")
+        roster_seq = getattr(self, 'roster_seq', None)
+        if roster_seq is not None and seq is not None and seq <= roster_seq:
+            return # Already covered by the last snapshot
+
+        if roster_seq is None or seq != roster_seq + 1:
+            # Missed a delta (or no snapshot yet): ask for a fresh snapshot once
+            if not getattr(self, '_roster_resync_pending', False) and hasattr(self, 'send_queue'):
+                self._roster_resync_pending = True
+                self.send_queue.put(json.dumps({"type": "request_player_list"}))
+            return
+
+        if data["type"] == "player_leave":
+            self.roster.pop(data.get("id"), None)
+        else:
+            player = data.get("player", {})
+            self.roster[player.get("id")] = player
+        self.roster_seq = seq
+        self._player_list_dirty = True
+
+    def _player_row(self, p):
+        """Text segments and tags for one player line."""
+        nick = p.get("nickname", "Unknown")
+        mod = p.get("modpack", "Vanilla")
+        in_game = p.get("in_game", False)
+        mode = p.get("game_mode", "Online")
+        color = p.get("color", "gray")
+        
+        # Use a clean tag name for color
+        clean_color = color.replace("#", "")
+        tag_name = f"plist_{clean_color}"
+        
+        if tag_name not in self.plist_tags:
+            self.player_list_box.tag_config(tag_name, foreground=color)
+            self.plist_tags.add(tag_name)
+        
+        # Status Text (Compact Format), translated once per combination
+        status_key = (mod, mode) if in_game else None
+        info_text = self.plist_status_cache.get(status_key)
+        if info_text is None:
+            if in_game:
+                # Abbreviate mod names
+                short_mod = mod
+                if mod == "Quality of Life": short_mod = "QoL"
+                elif mod == "Diablo Loot (RNG)": short_mod = "Diablo"
                 
-                # Add status info (Stay on left)
-                self.player_list_box.insert("end", info_text)
+                mode_key = "mode_seamless" if mode == "Seamless" else "mode_online"
+                info_text = f" ({short_mod} - {self._t(mode_key)})"
+            else:
+                status_text = self._t("status_launcher")
+                info_text = f" [{status_text}]"
+            self.plist_status_cache[status_key] = info_text
+        
+        segments = [f"• {nick}", tag_name]
+        
+        # Add tripcode if available
+        trip = p.get("tripcode", "")
+        if trip:
+            segments += [f" #{trip}", "tripcode_tag"]
+        
+        # Add status info (Stay on left)
+        segments += [info_text, ""]
 
-                # Add playtime if available (Push to right)
-                playtime = p.get("playtime", "")
-                if playtime:
-                     # Use \t to push it to the right-aligned tab stop
-                     self.player_list_box.insert("end", f"\t[{playtime}]", "tripcode_tag")
+        # Add playtime if available (Push to right)
+        playtime = p.get("playtime", "")
+        if playtime:
+            # Use \t to push it to the right-aligned tab stop
+            segments += [f"\t[{playtime}]", "tripcode_tag"]
 
-                self.player_list_box.insert("end", "\n")
-            self.player_list_box.configure(state="disabled")
+        segments += ["\n", ""]
+        return tuple(segments)
+
+    def render_player_list(self, players):
+        """Update the player list in place, touching only rows that changed."""
+        if not hasattr(self, 'player_list_box') or not self.player_list_box.winfo_exists():
+            return
+        if not hasattr(self, 'plist_tags'):
+            self.plist_tags = set()
+        
+        # Configure a subtle tag for tripcodes if not exists
+        if "tripcode_tag" not in self.plist_tags:
+            self.player_list_box.tag_config("tripcode_tag", foreground="#888888") # Muted gray
+            self.plist_tags.add("tripcode_tag")
+
+        new_rows = [(p.get("id", (p.get("nickname"), i)), self._player_row(p)) for i, p in enumerate(players)]
+        rows = self.plist_rows
+        if rows == new_rows:
+            return
+        textbox = self.player_list_box._textbox # Multi-segment inserts in one call
+        self.player_list_box.configure(state="normal")
+
+        # Players that left
+        new_keys = {key for key, _ in new_rows}
+        for i in range(len(rows) - 1, -1, -1):
+            if rows[i][0] not in new_keys:
+                textbox.delete(f"{i + 1}.0", f"{i + 2}.0")
+                del rows[i]
+
+        # Walk the new order: keep, update, move or insert each row
+        positions = {key: i for i, (key, _) in enumerate(rows)}
+        for i, (key, segments) in enumerate(new_rows):
+            if i < len(rows) and rows[i][0] == key:
+                if rows[i][1] != segments:
+                    textbox.delete(f"{i + 1}.0", f"{i + 2}.0")
+                    textbox.insert(f"{i + 1}.0", *segments)
+                    rows[i] = (key, segments)
+                continue
+            if key in positions:
+                # Moved: drop the old line (always below i) before inserting here
+                old = next(j for j in range(i, len(rows)) if rows[j][0] == key)
+                textbox.delete(f"{old + 1}.0", f"{old + 2}.0")
+                del rows[old]
+            textbox.insert(f"{i + 1}.0", *segments)
+            rows.insert(i, (key, segments))
+            positions[key] = i
+        self.player_list_box.configure(state="disabled")
+
+    def post_chat_events(self, *events):
+        """Queue events from the network thread and wake the UI dispatcher (once per drain)."""
+        for data in events:
+            self.chat_queue.put(data)
+        if not self._chat_wake_pending:
+            self._chat_wake_pending = True
+            try:
+                self.event_generate("<<ChatEvents>>", when="tail")
+            except (tk.TclError, RuntimeError):
+                # Main loop not running (startup/shutdown): the safety poll picks it up
+                self._chat_wake_pending = False
+
+    def _coalesce_chat_events(self, events):
+        """Drop events made obsolete by a later one in the same batch.
+
+        Only the last player_list, lobby_list, user_count and history are
+        kept; roster deltas before the last player_list and chat lines
+        before the last history are already part of those snapshots.
+        """
+        last = {data.get("type"): i for i, data in enumerate(events)}
+        last_roster = last.get("player_list", -1)
+        last_history = last.get("history", -1)
+        kept = []
+        for i, data in enumerate(events):
+            msg_type = data.get("type")
+            if msg_type in ("player_list", "lobby_list", "user_count", "history") and i != last[msg_type]:
+                continue
+            if msg_type in ("player_join", "player_update", "player_leave") and i < last_roster:
+                continue
+            if msg_type == "chat" and i < last_history:
+                continue
+            kept.append(data)
+        return kept
 
     def receive_chat_messages(self):
-        """Poll the chat queue and update the UI."""
+        """Render queued chat events in batches, within CHAT_UI_FRAME_BUDGET per call.
+
+        Woken by <<ChatEvents>> from the network thread; whatever doesn't fit
+        in the budget is carried over to the next frame.
+        """
+        self._chat_wake_pending = False # Before draining, so later events wake us again
+        if hasattr(self, '_chat_safety_poll'):
+            self.after_cancel(self._chat_safety_poll)
+        self._chat_safety_poll = self.after(self.CHAT_UI_SAFETY_POLL_MS, self.receive_chat_messages)
+
         if not hasattr(self, 'online_count'):
             self.online_count = 0
             
         # Safety check: Don't pop if UI is being rebuilt or not ready (need both widgets)
         if not hasattr(self, 'chat_history') or not self.chat_history.winfo_exists() or \
            not hasattr(self, 'player_list_box') or not self.player_list_box.winfo_exists():
-            self.after(200, self.receive_chat_messages)
+            self.after_cancel(self._chat_safety_poll)
+            self._chat_safety_poll = self.after(200, self.receive_chat_messages)
             return
 
+        events = self._chat_backlog
         try:
-            while not self.chat_queue.empty():
-                # Re-check UI readiness inside loop
-                if not self.chat_history.winfo_exists() or not self.player_list_box.winfo_exists():
-                    break
+            while True:
+                events.append(self.chat_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not events:
+            return
+        events = self._coalesce_chat_events(events)
+        self._chat_backlog = []
 
-                try:
-                    data = self.chat_queue.get_nowait()
-                except queue.Empty:
+        deadline = time.perf_counter() + self.CHAT_UI_FRAME_BUDGET
+        chat_added = False
+        self._player_list_dirty = False
+        self.chat_history.configure(state="normal")
+        try:
+            for i, data in enumerate(events):
+                if i and time.perf_counter() > deadline:
+                    self._chat_backlog = events[i:]
+                    self.after(1, self.receive_chat_messages)
                     break
-
-                if data["type"] == "status":
-                    if data["connected"]:
-                        if self.chat_status_label.winfo_exists():
-                            self.chat_status_label.configure(text=self._t("chat_connected"), text_color="green")
-                        
-                        # Ensure server knows our user_id immediately upon connection
-                        self.broadcast_status()
-                        
-                        # Show welcome message upon connection
-                        if not hasattr(self, '_welcome_shown'):
-                            self.chat_history.configure(state="normal")
-                            self.chat_history.insert("end", f"{self._t('chat_welcome')}\n", "system")
-                            self.chat_history.configure(state="disabled")
-                            self._welcome_shown = True
-                        
-                        # Initial count update if we already have it
-                        if self.player_list_label.winfo_exists():
-                            self.player_list_label.configure(text=f"{self._t('chat_online_players')} ({self.online_count})")
-
-                        # Send initial status update immediately after connection
-                        self.broadcast_status()
-                        
-                        # Also request history and player list
-                        if hasattr(self, 'send_queue'):
-                            self.send_queue.put(json.dumps({"type": "request_history"}))
-                            self.send_queue.put(json.dumps({"type": "request_player_list"}))
-
-                    else:
-                        if self.chat_status_label.winfo_exists():
-                            self.chat_status_label.configure(text=self._t("chat_disconnected"), text_color="gray")
-                        if self.player_list_label.winfo_exists():
-                            self.player_list_label.configure(text=self._t("chat_online_players"))
-                        
-                        # Try to reconnect after a delay
-                        self.after(5000, self.connect_chat)
-                
-                elif data["type"] == "user_count":
-                    self.online_count = data.get("count", 0)
-                    if self.player_list_label.winfo_exists():
-                        self.player_list_label.configure(text=f"{self._t('chat_online_players')} ({self.online_count})")
+                try:
+                    chat_added |= self._dispatch_chat_event(data)
+                except Exception as e:
+                    # Log error but don't stop the loop (e.g., if widget destroyed during update)
+                    # print(f"Chat UI dispatch error: {e}")
+                    pass
+        finally:
+            if self.chat_history.winfo_exists():
+                if chat_added:
+                    self.chat_history.see("end")
+                self.chat_history.configure(state="disabled")
+            # Deltas and snapshots in this batch render the roster once
+            if self._player_list_dirty:
+                self.render_player_list(list(self.roster.values()))
+
+    def _dispatch_chat_event(self, data):
+        """Apply one server event to the UI; True if chat text was added."""
+        if data["type"] == "status":
+            if data["connected"]:
+                if self.chat_status_label.winfo_exists():
+                    self.chat_status_label.configure(text=self._t("chat_connected"), text_color="green")
                 
-                elif data["type"] == "player_list":
-                    players = data.get("players", [])
-                    self.render_player_list(players)
-
-                elif data["type"] == "history":
-                    self.chat_history.configure(state="normal")
-                    self.chat_history.delete("1.0", "end")
-                    for entry in data.get("messages", []):
-                        self._add_to_history_ui(entry)
-                    self.chat_history.configure(state="disabled")
+                # Ensure server knows our user_id immediately upon connection
+                self.broadcast_status()
                 
-                elif data["type"] == "chat":
-                    self.chat_history.configure(state="normal")
-                    self._add_to_history_ui(data)
-                    self.chat_history.configure(state="disabled")
+                # Initial count update if we already have it
+                if self.player_list_label.winfo_exists():
+                    self.player_list_label.configure(text=f"{self._t('chat_online_players')} ({self.online_count})")
+
+                # Send initial status update immediately after connection
+                self.broadcast_status()
                 
-                elif data["type"] == "lobby_list":
-                    lobbies = data.get("lobbies", [])
-                    if hasattr(self, 'on_lobby_update'):
-                        self.on_lobby_update(lobbies)
+                # Also request history and player list
+                if hasattr(self, 'send_queue'):
+                    self.send_queue.put(json.dumps({"type": "request_history"}))
+                    self.send_queue.put(json.dumps({"type": "request_player_list"}))
+
+                # Show welcome message upon connection
+                if not hasattr(self, '_welcome_shown'):
+                    self.chat_history.insert("end", f"{self._t('chat_welcome')}\n", "system")
+                    self._track_chat_line(None, 1)
+                    self._welcome_shown = True
+                    return True
+
+            else:
+                if self.chat_status_label.winfo_exists():
+                    self.chat_status_label.configure(text=self._t("chat_disconnected"), text_color="gray")
+                if self.player_list_label.winfo_exists():
+                    self.player_list_label.configure(text=self._t("chat_online_players"))
                 
-                elif data["type"] == "leaderboard":
-                    self.on_leaderboard_received(data.get("entries", []))
+                # Try to reconnect after a delay
+                self.after(5000, self.connect_chat)
+        
+        elif data["type"] == "user_count":
+            self.online_count = data.get("count", 0)
+            if self.player_list_label.winfo_exists():
+                self.player_list_label.configure(text=f"{self._t('chat_online_players')} ({self.online_count})")
+        
+        elif data["type"] == "player_list":
+            self.on_player_list(data)
 
-        except Exception as e:
-            # Log error but don't stop the loop (e.g., if widget destroyed during update)
-            # print(f"Chat UI polling error: {e}")
-            pass
+        elif data["type"] in ("player_join", "player_update", "player_leave"):
+            self.apply_player_delta(data)
+
+        elif data["type"] == "history":
+            self._render_history(data.get("messages", []))
+            return True
+        
+        elif data["type"] == "chat":
+            self._add_to_history_ui(data)
+            return True
+        
+        elif data["type"] == "lobby_list":
+            lobbies = data.get("lobbies", [])
+            if hasattr(self, 'on_lobby_update'):
+                self.on_lobby_update(lobbies)
         
-        # Poll again soon
-        self.after(100, self.receive_chat_messages)
+        elif data["type"] == "leaderboard":
+            self.on_leaderboard_received(data.get("entries", []))
+        return False
+
+    @staticmethod
+    def _chat_key(data):
+        # The server's increasing message id; older servers don't send one
+        if isinstance(data.get("id"), int):
+            return data["id"]
+        return (data.get("time"), data.get("nickname"), data.get("message"), data.get("tripcode"))
+
+    def _render_history(self, entries):
+        """Show a history snapshot, appending only what's newer than the last displayed message."""
+        last_key = next((key for key, _ in reversed(self.chat_view_lines) if key is not None), None)
+        start = None
+        if isinstance(last_key, int):
+            # Everything after the last entry we've already seen by id
+            for i in range(len(entries) - 1, -1, -1):
+                key = self._chat_key(entries[i])
+                if isinstance(key, int) and key <= last_key:
+                    start = i + 1
+                    break
+        elif last_key is not None:
+            for i in range(len(entries) - 1, -1, -1):
+                if self._chat_key(entries[i]) == last_key:
+                    start = i + 1
+                    break
+        if start is None:
+            # Nothing in common with the view (first load or a gap): start over
+            self.chat_history.delete("1.0", "end")
+            self.chat_view_lines.clear()
+            start = max(0, len(entries) - self.CHAT_MAX_MESSAGES)
+        for entry in entries[start:]:
+            self._add_to_history_ui(entry)
+
+    def _track_chat_line(self, key, lines):
+        """Remember a displayed message and trim the oldest past CHAT_MAX_MESSAGES."""
+        view = self.chat_view_lines
+        view.append((key, lines))
+        if len(view) > self.CHAT_MAX_MESSAGES:
+            trimmed = 0
+            while len(view) > self.CHAT_MAX_MESSAGES:
+                trimmed += view.popleft()[1]
+            self.chat_history.delete("1.0", f"{trimmed + 1}.0")
 
     def _add_to_history_ui(self, data):
         """Helper to add a single message to the text box."""
@@ -2082,6 +2691,7 @@ class EldenRingLauncher(ctk.CTk):
             nick = data.get("nickname", "User")
             text = self._t(f"chat_{sys_msg}").format(nickname=nick)
             self.chat_history.insert("end", f"[{time_str}] {text}\n", "system")
+            self._track_chat_line(self._chat_key(data), text.count("\n") + 1)
         else:
             nick = data.get("nickname", "Unknown")
             msg = data.get("message", "")
@@ -2102,7 +2712,7 @@ class EldenRingLauncher(ctk.CTk):
                 self.chat_history.insert("end", f"({tripcode})", "tripcode")
             self.chat_history.insert("end", ": ", tag_name)
             self.chat_history.insert("end", f"{msg}\n")
-            self.chat_history.see("end")
+            self._track_chat_line(self._chat_key(data), msg.count("\n") + 1)
 
     def request_leaderboard(self):
         """Send a request for the leaderboard to the server."""
@@ -2223,24 +2833,22 @@ class EldenRingLauncher(ctk.CTk):
                       fg_color="#3e4a3d", hover_color="#4e5b4d", 
                       width=120, height=35, font=("Arial", 12, "bold")).pack(pady=15)
 
+    def on_game_state_change(self, running):
+        """Game process started or stopped (published by game_watcher)."""
+        self.game_active = running
+        self.broadcast_status()
+
     def monitor_process(self):
         try:
-            is_running = self.is_game_running()
+            is_running = self.game_watcher.poll()
             
             # Update lockdown status globally
             self.set_lockdown(is_running)
             
             if is_running:
                 self.update_status(self._t("now_running"), "#44ff44")
-                if not getattr(self, 'game_active', False):
-                    self.game_active = True
-                    self.broadcast_status() # Game just started
                 self.launch_start_time = 0 # Reset on successful launch
             else:
-                if getattr(self, 'game_active', False):
-                    self.game_active = False
-                    self.broadcast_status() # Game just stopped
-
                 # Status Reset Logic:
                 # If we are in "Launching" state (launch_start_time > 0)
                 if self.launch_start_time > 0:
@@ -2281,9 +2889,10 @@ class EldenRingLauncher(ctk.CTk):
 
     def start_background_tasks(self):
         """Consolidate background tasks that should run after UI is visible."""
+        profile_mark("fade in")
         print("[STARTUP] Starting background tasks...")
         self.check_for_updates()
-        self.check_for_modpack_updates()
+        self.check_for_modpack_updates(profile_phase="modpack check")
         self.monitor_process()
 
 
@@ -2313,31 +2922,22 @@ class EldenRingLauncher(ctk.CTk):
             self.status_label.configure(text=f"{self._t('dll_error_prefix')} {e}", text_color="#ff4444")
             return False
 
-    def is_game_running(self):
-        """Check if eldenring.exe is running using psutil (KISS)."""
-        import psutil
-        for proc in psutil.process_iter(['name']):
-            try:
-                if proc.info['name'].lower() == "eldenring.exe":
-                    return True
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-        return False
+    def is_game_running(self, fresh=False):
+        """Whether eldenring.exe is running, as last seen by game_watcher.
+
+        fresh=True checks now (with a full scan if no game PID is known),
+        for decisions like launching or rewriting game files.
+        """
+        if fresh:
+            return self.game_watcher.poll(force_scan=True)
+        return self.game_watcher.running
 
     def get_game_pid(self):
-        """Find the PID of eldenring.exe using psutil."""
+        """PID of eldenring.exe, if game_watcher has found it."""
         if hasattr(self, 'game_process') and self.game_process:
             if self.game_process.poll() is None:
                 return self.game_process.pid
-
-        import psutil
-        for proc in psutil.process_iter(['name', 'pid']):
-            try:
-                if proc.info['name'].lower() == "eldenring.exe":
-                    return proc.info['pid']
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-        return None
+        return self.game_watcher.pid
 
     def on_modpack_change(self, value):
         # Map translated value back to internal key
@@ -2367,7 +2967,7 @@ class EldenRingLauncher(ctk.CTk):
                 except:
                     pass
         
-        if self.game_dir and not self.is_game_running():
+        if self.game_dir and not self.is_game_running(fresh=True):
             self.apply_modpack(internal_key)
             
         # Sync settings regardless of whether we applied the modpack (e.g. if game running)
@@ -2579,25 +3179,11 @@ class EldenRingLauncher(ctk.CTk):
             print(f"Error updating TOML config: {e}")
 
     def save_config_value(self, key, value):
-        config = configparser.ConfigParser()
-        if os.path.exists(self.config_path):
-            config.read(self.config_path)
-        
-        if 'Main' not in config:
-            config['Main'] = {}
-        
-        config['Main'][key] = value
-        with open(self.config_path, 'w') as f:
-            config.write(f)
+        self.config_store.set(key, value)
 
     def read_config_value(self, key, fallback=None):
         try:
-            if os.path.exists(self.config_path):
-                config = configparser.ConfigParser()
-                config.read(self.config_path)
-                if 'Main' in config:
-                    return config['Main'].get(key, fallback)
-            return fallback
+            return self.config_store.get(key, fallback)
         except:
             return fallback
 
@@ -2729,7 +3315,7 @@ class EldenRingLauncher(ctk.CTk):
             print(f"Error broadcasting status: {e}")
 
     def launch_seamless(self):
-        if self.is_game_running():
+        if self.is_game_running(fresh=True):
             self.update_status(self._t("running"), "#ff4444")
             return
 
@@ -2763,13 +3349,14 @@ class EldenRingLauncher(ctk.CTk):
             self.last_game_mode = "Seamless"
             subprocess.Popen([self.launch_exe], cwd=self.game_dir)
             self.launch_start_time = time.time()
+            self.game_watcher.expect_start()
             self.broadcast_status()
             
         else:
             self.update_status(self._t("exe_not_found"), "#ff4444")
 
     def launch_online(self):
-        if self.is_game_running():
+        if self.is_game_running(fresh=True):
             self.update_status(self._t("running"), "#ff4444")
             return
             
@@ -2782,6 +3369,7 @@ class EldenRingLauncher(ctk.CTk):
             self.last_game_mode = "Online"
             subprocess.Popen([self.launch_exe], cwd=self.game_dir)
             self.launch_start_time = time.time()
+            self.game_watcher.expect_start()
             self.broadcast_status()
 
         else:
@@ -2806,6 +3394,9 @@ class EldenRingLauncher(ctk.CTk):
         # Main area
         self.lobby_list_frame = ctk.CTkScrollableFrame(self.lobby_overlay, fg_color="#1a1a1a", border_width=1, border_color="#333333")
         self.lobby_list_frame.pack(pady=10, padx=20, fill="both", expand=True)
+        self.lobby_rows = {} # (host, password, n): row widgets, in display order
+        self.lobby_row_pool = [] # Hidden rows kept for reuse
+        self.lobby_empty_label = None
         
         # Bottom: Control Buttons
         btn_frame = ctk.CTkFrame(self.lobby_overlay, fg_color="transparent")
@@ -2835,30 +3426,73 @@ class EldenRingLauncher(ctk.CTk):
         if hasattr(self, 'lobby_list_frame') and self.lobby_list_frame.winfo_exists():
             self.render_lobby_list(lobbies)
             
+    def _create_lobby_row(self):
+        row = ctk.CTkFrame(self.lobby_list_frame, fg_color="#121212", corner_radius=8)
+        info_label = ctk.CTkLabel(row, text="", font=("Arial", 12, "bold"))
+        info_label.pack(side="left", padx=15, pady=10)
+        join_button = ctk.CTkButton(row, text=self._t("btn_join"), width=100, height=30,
+                                    fg_color="#3e4a3d", hover_color="#4e5b4d", font=("Arial", 11, "bold"))
+        join_button.pack(side="right", padx=15)
+        return {"row": row, "label": info_label, "button": join_button, "text": None, "color": None, "password": None}
+
     def render_lobby_list(self, lobbies):
-        # Clear existing list
-        for widget in self.lobby_list_frame.winfo_children():
-            widget.destroy()
-            
-        if not lobbies:
-            ctk.CTkLabel(self.lobby_list_frame, text=self._t("lobby_no_active"), text_color="gray").pack(pady=50)
-            return
-            
+        """Update the lobby rows in place; only rows that appeared or disappeared are created or removed."""
+        wanted = []
+        seen = {}
         for lobby in lobbies:
             nick = lobby.get("nickname", "Unknown")
             pwd = lobby.get("password", "???")
+            n = seen[(nick, pwd)] = seen.get((nick, pwd), 0) + 1
+            wanted.append(((nick, pwd, n), lobby))
+
+        # Rows whose lobby is gone go back to the pool (or are destroyed when it's full)
+        wanted_keys = {key for key, _ in wanted}
+        for key in [k for k in self.lobby_rows if k not in wanted_keys]:
+            widgets = self.lobby_rows.pop(key)
+            widgets["row"].pack_forget()
+            if len(self.lobby_row_pool) < self.LOBBY_ROW_POOL_SIZE:
+                self.lobby_row_pool.append(widgets)
+            else:
+                widgets["row"].destroy()
+
+        if not lobbies:
+            if self.lobby_empty_label is None:
+                self.lobby_empty_label = ctk.CTkLabel(self.lobby_list_frame, text=self._t("lobby_no_active"), text_color="gray")
+            self.lobby_empty_label.pack(pady=50)
+            return
+        if self.lobby_empty_label is not None:
+            self.lobby_empty_label.pack_forget()
+
+        # Appending new rows keeps the order unless existing rows moved or a new one goes between them
+        kept = [key for key, _ in wanted if key in self.lobby_rows]
+        added = [key for key, _ in wanted if key not in self.lobby_rows]
+        order_changed = kept != list(self.lobby_rows) or kept + added != [key for key, _ in wanted]
+        rows = {}
+        for key, lobby in wanted:
+            nick, pwd, _ = key
+            widgets = self.lobby_rows.get(key)
+            if widgets is None:
+                widgets = self.lobby_row_pool.pop() if self.lobby_row_pool else self._create_lobby_row()
+                if not order_changed:
+                    widgets["row"].pack(pady=5, padx=5, fill="x") # New rows go at the end
+            rows[key] = widgets
+
+            text = f"{self._t('lobby_host_name')} {nick}  |  {self._t('lobby_password')} {pwd}"
             color = lobby.get("color", "gray")
-            
-            row = ctk.CTkFrame(self.lobby_list_frame, fg_color="#121212", corner_radius=8)
-            row.pack(pady=5, padx=5, fill="x")
-            
-            info_label = ctk.CTkLabel(row, text=f"{self._t('lobby_host_name')} {nick}  |  {self._t('lobby_password')} {pwd}", 
-                                      font=("Arial", 12, "bold"), text_color=color)
-            info_label.pack(side="left", padx=15, pady=10)
-            
-            # Using partial or lambda p=pwd to avoid closure issues
-            ctk.CTkButton(row, text=self._t("btn_join"), command=lambda p=pwd: self.join_lobby_by_pwd(p),
-                          width=100, height=30, fg_color="#3e4a3d", hover_color="#4e5b4d", font=("Arial", 11, "bold")).pack(side="right", padx=15)
+            if widgets["text"] != text or widgets["color"] != color:
+                widgets["label"].configure(text=text, text_color=color)
+                widgets["text"], widgets["color"] = text, color
+            if widgets["password"] != pwd:
+                widgets["button"].configure(command=lambda p=pwd: self.join_lobby_by_pwd(p))
+                widgets["password"] = pwd
+
+        if order_changed:
+            # Re-pack in the server's order (cheap next to creating widgets)
+            for widgets in rows.values():
+                widgets["row"].pack_forget()
+            for widgets in rows.values():
+                widgets["row"].pack(pady=5, padx=5, fill="x")
+        self.lobby_rows = rows
 
     def host_public_lobby(self):
         # Get password from settings
@@ -2917,6 +3551,7 @@ class EldenRingLauncher(ctk.CTk):
 
     def download_file_with_progress(self, url, dest_path, progress_callback=None):
         """Standard download logic with cache-busting and progress reporting."""
+        import urllib.request
         try:
             # 1. Add cache-busting timestamp to URL
             cache_sep = "&" if "?" in url else "?"
@@ -3004,6 +3639,7 @@ class EldenRingLauncher(ctk.CTk):
         
     def run_reforged_download(self):
         """Sequential download and extraction of Reforged modpack (KISS)."""
+        import zipfile
         urls = [
             "https://github.com/conan513/er_launcher/releases/download/v1/mod_err.zip.001",
             "https://github.com/conan513/er_launcher/releases/download/v1/mod_err.zip.002"
@@ -3379,6 +4015,7 @@ class EldenRingLauncher(ctk.CTk):
     def check_for_updates(self):
         """Check for updates in a background thread with cache-busting."""
         def check():
+            import urllib.request
             try:
                 # Cache-busting: add timestamp to URL
                 url = f"{self.VERSION_URL}?t={int(time.time())}"
@@ -3403,7 +4040,7 @@ class EldenRingLauncher(ctk.CTk):
             except Exception as e:
                 print(f"Update check failed: {e}")
 
-        threading.Thread(target=check, daemon=True).start()
+        threading.Thread(target=run_then_mark(check, "version check"), daemon=True).start()
 
     def show_update_available(self, new_version):
         """Show the update button in the UI."""
@@ -3474,6 +4111,7 @@ del "%~f0"
             subprocess.Popen(f'"{bat_path}"', shell=True, creationflags=subprocess.CREATE_NEW_CONSOLE)
             
             # Exit launcher
+            self.config_store.flush() # os._exit skips atexit
             self.after(200, lambda: os._exit(0))
             
         except Exception as e:
@@ -3485,9 +4123,15 @@ del "%~f0"
         self.after(3000, lambda: self.update_btn.configure(text=self._t("update_available_btn"), fg_color="#e15f41"))
         print(f"Detailed Error: {error}")
 
-    def check_for_modpack_updates(self):
-        """Check for modpack updates by comparing local modpack.txt with remote version."""
+    def check_for_modpack_updates(self, profile_phase=None):
+        """Check for modpack updates by comparing local modpack.txt with remote version.
+
+        Only the check started after the fade-in is timed for --profile-startup
+        (`profile_phase`); the earlier ones from load_config/setup_ui would overlap
+        the main-thread phases.
+        """
         def check():
+            import urllib.request
             if not self.game_dir:
                 print("[UPDATE] Skipping check: No game directory set.")
                 return
@@ -3527,7 +4171,7 @@ del "%~f0"
             except Exception as e:
                 print(f"[UPDATE] Modpack update check failed: {e}")
 
-        threading.Thread(target=check, daemon=True).start()
+        threading.Thread(target=run_then_mark(check, profile_phase), daemon=True).start()
 
     def show_modpack_update_available(self, updates_found=None):
         """Set update flag and refresh UI."""
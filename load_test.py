@@ -0,0 +1,335 @@
+"""Load generator for the chat/lobby WebSocket server.
+
+Starts a private server.py on localhost (or targets --url) and connects
+thousands of simulated launchers that follow the same protocol as
+EldenRingLauncher: hello, a status_update every --status-interval seconds
+(60s like monitor_process), chat bursts, request_player_list, host_lobby
+and request_leaderboard.
+
+Example:
+    python load_test.py --clients 2000 --duration 120
+
+Reports chat fan-out latency (send -> receipt on every other client),
+messages/sec, downstream bytes per client (on the wire and after
+permessage-deflate; --compact-fraction and --no-compression compare the encodings)
+and the server RSS/CPU (summed over its worker processes
+with --server-workers). Linux only for the RSS/CPU sampling and the
+per-client loopback addresses (127.x.y.z), which keep the server's
+per-IP chat rate limit realistic without any real network.
+All simulated clients share one process; for very large counts run
+several instances against one server with --url/--server-pid.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import websockets
+from websockets.asyncio.client import ClientConnection
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+CHAT_MARKER = "[lt]"
+# The keys this script reads, as sent to clients with the "compact" capability
+COMPACT_KEYS = {"type": "t", "messages": "ms", "message": "m", "nickname": "n"}
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.received_by_type = {}
+        self.fanout_latencies = []
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.wire_bytes = 0  # Received from the socket, compressed if deflate was negotiated
+        self.payload_bytes = 0  # Received message text after decompression
+
+
+def counting_connection(stats):
+    """ClientConnection class that adds every received socket chunk to stats.wire_bytes."""
+    class CountingConnection(ClientConnection):
+        def data_received(self, data):
+            stats.wire_bytes += len(data)
+            super().data_received(data)
+    return CountingConnection
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def raise_fd_limit(needed):
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < needed:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def loopback_address(index):
+    """Spread clients over 127.0.0.0/8 so each one has its own source IP."""
+    index += 2
+    return f"127.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+
+async def wait_for_port(host, port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.2)
+    return False
+
+
+async def chat_bursts(args, chat_pending, stop):
+    """Every ~1/--chat-rate seconds, make 1..--burst random clients chat at once."""
+    while not stop.is_set():
+        await asyncio.sleep(random.expovariate(args.chat_rate))
+        for index in random.sample(range(args.clients), min(args.clients, random.randint(1, args.burst))):
+            chat_pending[index] = True
+
+
+async def run_client(index, args, stats, stop, chat_pending):
+    user_id = str(uuid.uuid4())
+    nickname = f"Load_{index:05d}"
+    # Only clients that send hello can announce the compact encoding
+    hello = random.random() >= args.legacy_fraction
+    compact = hello and random.random() < args.compact_fraction
+    full_keys = {key: key for key in COMPACT_KEYS}
+    kwargs = {"open_timeout": 30, "max_size": None, "create_connection": stats.connection_class}
+    if not args.compression:
+        kwargs["compression"] = None
+    if args.spread_ips:
+        kwargs["local_addr"] = (loopback_address(index), 0)
+    try:
+        websocket = await websockets.connect(args.url, **kwargs)
+    except Exception:
+        stats.connect_failures += 1
+        return
+
+    async def send(payload):
+        await websocket.send(json.dumps(payload, ensure_ascii=False))
+        stats.sent += 1
+
+    async def receive():
+        async for message in websocket:
+            received_at = time.perf_counter()
+            stats.payload_bytes += len(message)
+            data = json.loads(message)
+            # Frames sent before the server handled our hello still use full keys
+            keys = COMPACT_KEYS if compact and "type" not in data else full_keys
+            parts = data.get(keys["messages"], []) if data.get(keys["type"]) == "batch" else [data]
+            for part in parts:
+                msg_type = part.get(keys["type"], "?")
+                stats.received += 1
+                stats.received_by_type[msg_type] = stats.received_by_type.get(msg_type, 0) + 1
+                text = part.get(keys["message"], "") if msg_type == "chat" else ""
+                if text.startswith(CHAT_MARKER) and part.get(keys["nickname"]) != nickname:
+                    stats.fanout_latencies.append(received_at - float(text[len(CHAT_MARKER):]))
+
+    async def status(in_game):
+        await send({
+            "type": "status_update",
+            "nickname": nickname,
+            "modpack": random.choice(["Vanilla", "Reforged", "Quality of Life"]),
+            "in_game": in_game,
+            "game_mode": random.choice(["Online", "Seamless"]),
+            "user_id": user_id,
+        })
+
+    receiver = asyncio.create_task(receive())
+    try:
+        if hello:
+            await send({"type": "hello", "caps": ["roster_delta", "batch", "compact"] if compact else ["roster_delta", "batch"]})
+        in_game = random.random() < 0.5
+        await status(in_game)
+        next_status = time.monotonic() + random.uniform(0, args.status_interval)
+        while not stop.is_set():
+            await asyncio.sleep(random.uniform(0.5, 1.5))
+            now = time.monotonic()
+            if now >= next_status:
+                if random.random() < 0.05:
+                    in_game = not in_game
+                await status(in_game)
+                next_status = now + args.status_interval
+            if chat_pending[index]:
+                chat_pending[index] = False
+                await send({"type": "chat", "nickname": nickname, "user_id": user_id,
+                            "message": f"{CHAT_MARKER}{time.perf_counter()}"})
+            roll = random.random()
+            if roll < 0.002:
+                await send({"type": "request_leaderboard"})
+            elif roll < 0.004:
+                await send({"type": "request_player_list"})
+            elif roll < 0.005 and in_game:
+                await send({"type": "host_lobby", "password": f"pw{index}"})
+    except websockets.exceptions.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        receiver.cancel()
+        await websocket.close()
+
+
+def sample_server(proc, samples, tracked):
+    """Record RSS and CPU of the server, summed over its worker processes if any."""
+    rss = cpu = 0
+    for p in [proc] + proc.children():
+        p = tracked.setdefault(p.pid, p)  # cpu_percent() needs the same object across calls
+        try:
+            rss += p.memory_info().rss
+            cpu += p.cpu_percent(interval=None)
+        except Exception:
+            pass
+    samples.append((rss, cpu))
+
+
+async def run(args):
+    server = None
+    data_dir = None
+    try:
+        if not args.url:
+            port = free_port()
+            data_dir = tempfile.mkdtemp(prefix="er_load_")
+            env = dict(os.environ, ER_SERVER_HOST="127.0.0.1", ER_SERVER_PORT=str(port), ER_SERVER_DATA_DIR=data_dir,
+                       ER_SERVER_WORKERS=str(args.server_workers))
+            server = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            args.url = f"ws://127.0.0.1:{port}"
+            args.server_pid = server.pid
+            if not await wait_for_port("127.0.0.1", port):
+                server.kill()
+                raise SystemExit("Server did not start listening in time.")
+            print(f"Started server.py (pid {server.pid}) on port {port}, data in {data_dir}")
+
+        proc = psutil.Process(args.server_pid) if psutil and args.server_pid else None
+        if proc:
+            if args.server_workers > 1:
+                await asyncio.sleep(1)  # Let the workers bind the port too
+            tracked = {}
+            sample_server(proc, [], tracked)
+
+        stats = Stats()
+        stats.connection_class = counting_connection(stats)
+        stop = asyncio.Event()
+        chat_pending = [False] * args.clients
+        samples = []
+        clients = []
+        started = time.perf_counter()
+        print(f"Connecting {args.clients} clients at {args.ramp}/s to {args.url} ...")
+        for i in range(args.clients):
+            clients.append(asyncio.create_task(run_client(i, args, stats, stop, chat_pending)))
+            if (i + 1) % args.ramp == 0:
+                await asyncio.sleep(1)
+                if proc:
+                    sample_server(proc, samples, tracked)
+
+        measure_from = time.perf_counter()
+        bursts = asyncio.create_task(chat_bursts(args, chat_pending, stop))
+        stats.fanout_latencies.clear()
+        received_before, sent_before = stats.received, stats.sent
+        wire_before, payload_before = stats.wire_bytes, stats.payload_bytes
+        while time.perf_counter() - measure_from < args.duration:
+            await asyncio.sleep(1)
+            if proc:
+                sample_server(proc, samples, tracked)
+        elapsed = time.perf_counter() - measure_from
+        received, sent = stats.received - received_before, stats.sent - sent_before
+        wire, payload = stats.wire_bytes - wire_before, stats.payload_bytes - payload_before
+        stop.set()
+        bursts.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+        latencies_ms = [l * 1000 for l in stats.fanout_latencies]
+        report = {
+            "clients": args.clients,
+            "server_workers": args.server_workers,
+            "connect_failures": stats.connect_failures,
+            "disconnects": stats.disconnects,
+            "ramp_seconds": round(measure_from - started, 1),
+            "measured_seconds": round(elapsed, 1),
+            "messages_sent_per_sec": round(sent / elapsed, 1),
+            "messages_received_per_sec": round(received / elapsed, 1),
+            "compression": args.compression,
+            "compact_fraction": args.compact_fraction,
+            "wire_bytes_per_client_per_sec": round(wire / elapsed / args.clients, 1),
+            "payload_bytes_per_client_per_sec": round(payload / elapsed / args.clients, 1),
+            "fanout_samples": len(latencies_ms),
+            "fanout_p50_ms": round(percentile(latencies_ms, 50), 2),
+            "fanout_p99_ms": round(percentile(latencies_ms, 99), 2),
+            "fanout_max_ms": round(max(latencies_ms, default=0), 2),
+            "server_rss_max_mb": round(max((s[0] for s in samples), default=0) / 2**20, 1),
+            "server_cpu_avg_pct": round(sum(s[1] for s in samples) / len(samples), 1) if samples else 0,
+            "server_cpu_max_pct": round(max((s[1] for s in samples), default=0), 1),
+            "received_by_type": dict(sorted(stats.received_by_type.items())),
+        }
+        print(json.dumps(report, indent=2))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return report
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ER Launcher chat server.")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to measure after all clients connected")
+    parser.add_argument("--ramp", type=int, default=200, help="Clients connected per second")
+    parser.add_argument("--status-interval", type=float, default=60, help="Seconds between status_update per client")
+    parser.add_argument("--chat-rate", type=float, default=2, help="Average chat bursts per second across all clients")
+    parser.add_argument("--burst", type=int, default=5, help="Max clients chatting at once in a burst")
+    parser.add_argument("--legacy-fraction", type=float, default=0.0, help="Share of clients that skip the hello handshake")
+    parser.add_argument("--compact-fraction", type=float, default=0.0,
+                        help="Share of clients that announce the compact (short key) encoding")
+    parser.add_argument("--no-compression", dest="compression", action="store_false",
+                        help="Don't negotiate permessage-deflate")
+    parser.add_argument("--server-workers", type=int, default=1,
+                        help="ER_SERVER_WORKERS for the started server (multi-process mode, Linux)")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS/CPU from when using --url")
+    parser.add_argument("--no-spread-ips", dest="spread_ips", action="store_false",
+                        help="Connect every client from 127.0.0.1 (the server then rate limits chat for all of them as one IP)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    raise_fd_limit(args.clients * 2 + 256)
+    if args.spread_ips and not sys.platform.startswith("linux"):
+        args.spread_ips = False
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,47 @@ import logging
 import time
 import os
 import hashlib
+import signal
+import threading
+import itertools
+import functools
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import types
+from collections import deque, OrderedDict
 
-SERVER_BASE = os.path.dirname(os.path.abspath(__file__))
+try:
+    import orjson # Optional faster JSON codec
+except ImportError:
+    orjson = None
+
+# Data/log directory, listen address and port can be overridden (used by load_test.py)
+SERVER_BASE = os.environ.get("ER_SERVER_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
+SERVER_HOST = os.environ.get("ER_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("ER_SERVER_PORT", "8765"))
+# Multi-process mode (Linux only): with ER_SERVER_WORKERS > 1 this process becomes the bus
+# broker and the only writer of user data and chat history, and starts that many worker
+# processes that share SERVER_PORT via SO_REUSEPORT and sync state over a Unix socket.
+# Workers never read the data files: the broker sends them the leaderboard and chat
+# history when they join the bus and user records as they change. Nickname colors are
+# still picked per process, so one nickname can show in different colors on clients
+# connected to different workers (every message carries its color, so each client's
+# view stays consistent).
+SERVER_WORKERS = int(os.environ.get("ER_SERVER_WORKERS", "1"))
+if SERVER_WORKERS > 1 and not sys.platform.startswith("linux"):
+    SERVER_WORKERS = 1
+SERVER_ROLE = os.environ.get("ER_SERVER_ROLE") or ("broker" if SERVER_WORKERS > 1 else "single")
+IS_WORKER = SERVER_ROLE == "worker"
+WORKER_INDEX = int(os.environ.get("ER_WORKER_INDEX", "0"))
+BUS_PATH = os.environ.get("ER_BUS_PATH") or os.path.join(tempfile.gettempdir(), f"er_server_bus_{SERVER_PORT}.sock")
+BUS_READ_LIMIT = 64 * 1024 * 1024
+# "auto" uses orjson when installed, "json" forces the standard library codec
+JSON_CODEC = "orjson" if orjson is not None and os.environ.get("ER_JSON_CODEC", "auto").lower() != "json" else "json"
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - ' + (f'[w{WORKER_INDEX}] ' if IS_WORKER else '') + '%(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler(os.path.join(SERVER_BASE, "server.log"), encoding='utf-8'),
         logging.StreamHandler()
@@ -17,17 +53,89 @@ logging.basicConfig(
 )
 
 CLIENTS = {} # websocket: {"nickname": "Unknown", "modpack": "Vanilla", "color": "#gray"}
-CHAT_HISTORY = []
 MAX_HISTORY = 100
+CHAT_HISTORY = deque(maxlen=MAX_HISTORY)
+CHAT_LAST_ID = 0 # Highest chat message "id" seen (see next_chat_id)
 LOBBIES = {} # websocket: {"password": "...", "nickname": "...", "color": "..."}
 MAX_MESSAGE_LENGTH = 500
 RATE_LIMIT_SECONDS = 3
-IP_LAST_MESSAGE_TIME = {}
-NICKNAME_COLOR_MAP = {}
-LOG_FILE = os.path.join(SERVER_BASE, "chat_log.json")
+# Token bucket limits per message type: (tokens per second, burst). Each message needs a
+# token from both the sender's IP bucket and user_id bucket. Override or add types with
+# ER_RATE_LIMITS="chat=0.5:2,host_lobby=0.1:3".
+RATE_LIMITS = {"chat": (1 / RATE_LIMIT_SECONDS, 1)}
+for _spec in filter(None, os.environ.get("ER_RATE_LIMITS", "").split(",")):
+    _type, _, _limit = _spec.partition("=")
+    _rate, _, _burst = _limit.partition(":")
+    RATE_LIMITS[_type.strip()] = (float(_rate), float(_burst or 1))
+RATE_BUCKETS = {} # message type: OrderedDict(key: [tokens, last update]), least recently used first
+NICKNAME_COLOR_MAP = {} # nickname: color, only while a connected client of this process uses it
+NICKNAME_REFS = {} # nickname: number of connected clients using it
+COLOR_HOLDERS = {} # color: number of nicknames holding it
+LOG_FILE = os.path.join(SERVER_BASE, "chat_log.jsonl") # Append-only journal, one entry per line
+CHAT_JOURNAL = None # Open append handle to LOG_FILE
+CHAT_JOURNAL_LINES = 0
+CHAT_JOURNAL_COMPACT_LINES = int(os.environ.get("ER_CHAT_JOURNAL_COMPACT_LINES", str(MAX_HISTORY * 10)))
 USER_DATA_FILE = os.path.join(SERVER_BASE, "user_data.json")
 USER_DATA = {} # user_id: {"nickname": "...", "tripcode": "...", "playtime": 0}
+# Storage backend: "json" keeps every user in USER_DATA and rewrites USER_DATA_FILE,
+# "sqlite" keeps only online/dirty users in USER_DATA and upserts rows into USER_DB_FILE.
+USER_STORE = os.environ.get("ER_USER_STORE", "json").lower()
+USER_DB_FILE = os.path.join(SERVER_BASE, "user_data.db")
+USER_DB = None # sqlite3.Connection when USER_STORE == "sqlite"
+LEADERBOARD_SIZE = 50
+# Top LEADERBOARD_SIZE users kept current as playtime is credited (playtime only grows,
+# so a user outside the top can only enter it, never be skipped over).
+LEADERBOARD_TOP = {} # user_id: {"nickname": "...", "tripcode": "...", "playtime": 0}
+LEADERBOARD_FLOOR = 0 # Lowest playtime in a full LEADERBOARD_TOP
+LEADERBOARD_FRAMES = {} # compact: cached encoded "leaderboard" frame, cleared on any change
+# Write-behind persistence: changed users are marked dirty and flushed in batches
+USER_DATA_DIRTY = set()
+USER_DATA_FLUSH_INTERVAL = float(os.environ.get("ER_USER_DATA_FLUSH_INTERVAL", "10"))
+USER_DATA_FLUSH_THRESHOLD = int(os.environ.get("ER_USER_DATA_FLUSH_THRESHOLD", "500"))
+USER_DATA_FLUSH_EVENT = None # asyncio.Event, created in main()
+USER_DATA_WRITE_LOCK = threading.Lock()
+# Backpressure: a client with more than BROADCAST_HIGH_WATER bytes in its transport gets
+# a per-connection outbox (at most OUTBOX_MAX_BYTES) drained by its own task, so healthy
+# clients never wait for it. Roster frames are not queued for it; it gets one fresh
+# snapshot once the outbox drains. A client whose outbox stays full (frames dropped and
+# none sent since) for SLOW_CLIENT_TIMEOUT seconds is disconnected.
+BROADCAST_HIGH_WATER = int(os.environ.get("ER_BROADCAST_HIGH_WATER", str(256 * 1024)))
+OUTBOX_MAX_BYTES = int(os.environ.get("ER_OUTBOX_MAX_BYTES", str(1024 * 1024)))
+SLOW_CLIENT_TIMEOUT = float(os.environ.get("ER_SLOW_CLIENT_TIMEOUT", "30"))
+SLOW_CLIENTS = set() # websockets with an outbox being drained
+HISTORY_FRAMES = {} # compact: cached encoded "history" frame, cleared when a message is added
+# permessage-deflate with websockets' defaults ("deflate"), or "off" to compare bandwidth
+WS_COMPRESSION = os.environ.get("ER_WS_COMPRESSION", "deflate").lower()
+# Clients announcing the "compact" capability get messages with the short keys below
+# (launcher.py keeps the reverse table). Values and message types are unchanged.
+COMPACT_CAP = "compact"
+COMPACT_KEYS = {
+    "type": "t", "nickname": "n", "message": "m", "messages": "ms", "time": "tm",
+    "color": "c", "tripcode": "tc", "players": "pl", "player": "p", "seq": "s",
+    "id": "i", "modpack": "mp", "in_game": "ig", "game_mode": "gm", "playtime": "pt",
+    "playtime_seconds": "pts", "count": "ct", "lobbies": "lb", "password": "pw", "entries": "e",
+}
+# Versioned roster: clients announcing the "roster_delta" capability get a snapshot
+# once, then player_join/player_update/player_leave deltas numbered by ROSTER_SEQ.
+ROSTER_DELTA_CAP = "roster_delta"
+ROSTER_SEQ = 0
+ROSTER_PUBLISHED = {} # pid: player entry as last announced
+PLAYERS_BY_PID = {} # pid: websocket
+PLAYER_IDS = itertools.count(1)
+# Roster, lobby and user count changes are collected for this many seconds and
+# sent as one combined update per window (0 sends immediately).
+ROSTER_COALESCE_WINDOW = float(os.environ.get("ER_ROSTER_COALESCE_WINDOW", "0.15"))
+ROSTER_BATCH_CAP = "batch"
+PENDING_ROSTER_PIDS = set()
+PENDING_LOBBIES = False
+PENDING_USER_COUNT = False
+ROSTER_FLUSH_HANDLE = None
+BUS = None # Worker: StreamWriter to the broker
+BUS_WORKERS = {} # Broker: worker index -> StreamWriter
+REMOTE_PLAYERS = {} # pid: player entry for players connected to other workers
+REMOTE_LOBBIES = {} # pid: lobby hosted by a player on another worker
 # Old files for migration
+OLD_LOG_FILE = os.path.join(SERVER_BASE, "chat_log.json")
 PLAYTIME_FILE = os.path.join(SERVER_BASE, "playtime.json")
 USER_METADATA_FILE = os.path.join(SERVER_BASE, "user_metadata.json")
 COLOR_PALETTE = [
@@ -46,54 +154,474 @@ COLOR_PALETTE = [
     "#706fd3", "#f7f1e3", "#34ace0", "#ff5252", "#ff793f",
     "#d1ccc0", "#ffb142", "#ffda79", "#cc8e35", "#ccae62"
 ]
+METRICS = {
+    "user_data_flushes": 0,
+    "user_data_users_flushed": 0,
+    "user_data_bytes_written": 0,
+    "user_data_last_flush_ms": 0.0,
+    "user_data_max_flush_ms": 0.0,
+    "user_data_flush_errors": 0,
+    "broadcast_frames": 0,
+    "broadcast_recipients": 0,
+    "broadcast_bytes": 0,
+    "outbox_frames_queued": 0,
+    "outbox_frames_dropped": 0,
+    "roster_frames_coalesced": 0,
+    "slow_clients_disconnected": 0,
+    "roster_changes": 0,
+    "roster_flushes": 0,
+    "roster_deltas_sent": 0,
+    "roster_coalesce_window_ms": 0.0,
+    "bus_messages_in": 0,
+    "bus_messages_out": 0,
+    "event_loop_lag_last_ms": 0.0,
+    "event_loop_lag_max_ms": 0.0,
+    "messages_rejected": 0,
+    "messages_rate_limited": 0,
+}
+# Metrics surface: Prometheus text on http://ER_METRICS_HOST:ER_METRICS_PORT/metrics
+# (JSON on /metrics.json; 0 = off, workers listen on ER_METRICS_PORT + 1 + their index)
+# and/or a JSON dump to metrics.json every ER_METRICS_DUMP_INTERVAL seconds (0 = off).
+METRICS_HOST = os.environ.get("ER_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("ER_METRICS_PORT", "0"))
+METRICS_DUMP_INTERVAL = float(os.environ.get("ER_METRICS_DUMP_INTERVAL", "0"))
+METRICS_DUMP_FILE = os.path.join(SERVER_BASE, f"metrics_w{WORKER_INDEX}.json" if IS_WORKER else "metrics.json")
+LOOP_LAG_INTERVAL = 0.5
+MESSAGES_IN = {} # message type: count
+MESSAGES_OUT = {} # message type: frames sent (one per recipient)
+HANDLER_CPU = {} # message type: [calls, CPU seconds]
+
+def new_histogram(buckets):
+    return {"buckets": buckets, "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+
+def observe(histogram, value):
+    counts = histogram["counts"]
+    for i, bound in enumerate(histogram["buckets"]):
+        if value <= bound:
+            counts[i] += 1
+            break
+    else:
+        counts[-1] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+HISTOGRAMS = {
+    "broadcast_seconds": new_histogram((0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    "broadcast_recipients": new_histogram((1, 10, 50, 100, 500, 1000, 2500, 5000, 10000)),
+    "user_data_flush_seconds": new_histogram((0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    "event_loop_lag_seconds": new_histogram((0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)),
+}
 
 import random
 
-def get_nickname_color(nickname):
-    if nickname not in NICKNAME_COLOR_MAP:
-        # Try to find a color that isn't currently used
-        used_colors = set(NICKNAME_COLOR_MAP.values())
-        available_colors = [c for c in COLOR_PALETTE if c not in used_colors]
-        
-        if available_colors:
-            NICKNAME_COLOR_MAP[nickname] = random.choice(available_colors)
-        else:
-            # Fallback to random if all palette colors are used
-            NICKNAME_COLOR_MAP[nickname] = random.choice(COLOR_PALETTE)
-            
-    return NICKNAME_COLOR_MAP[nickname]
+FREE_COLORS = random.sample(COLOR_PALETTE, len(COLOR_PALETTE)) # Unused colors in random order
+
+def _acquire_nickname_color(nickname):
+    NICKNAME_REFS[nickname] = NICKNAME_REFS.get(nickname, 0) + 1
+    color = NICKNAME_COLOR_MAP.get(nickname)
+    if color is None:
+        # Take a color that isn't currently used, or share a random one if all are taken
+        color = FREE_COLORS.pop() if FREE_COLORS else random.choice(COLOR_PALETTE)
+        NICKNAME_COLOR_MAP[nickname] = color
+        COLOR_HOLDERS[color] = COLOR_HOLDERS.get(color, 0) + 1
+    return color
+
+def _release_nickname_color(nickname):
+    refs = NICKNAME_REFS.get(nickname, 0) - 1
+    if refs > 0:
+        NICKNAME_REFS[nickname] = refs
+        return
+    NICKNAME_REFS.pop(nickname, None)
+    color = NICKNAME_COLOR_MAP.pop(nickname, None)
+    if color is None:
+        return
+    holders = COLOR_HOLDERS.get(color, 0) - 1
+    if holders > 0:
+        COLOR_HOLDERS[color] = holders
+        return
+    COLOR_HOLDERS.pop(color, None)
+    # Back into the free pool at a random position (swap with a random slot)
+    FREE_COLORS.append(color)
+    i = random.randrange(len(FREE_COLORS))
+    FREE_COLORS[i], FREE_COLORS[-1] = FREE_COLORS[-1], FREE_COLORS[i]
+
+def get_nickname_color(meta, nickname):
+    """Color for a client's nickname; its previous nickname's color is released."""
+    if meta.get("color_nickname") == nickname:
+        return NICKNAME_COLOR_MAP[nickname]
+    color = _acquire_nickname_color(nickname)
+    if meta.get("color_nickname") is not None:
+        _release_nickname_color(meta["color_nickname"])
+    meta["color_nickname"] = nickname
+    return color
+
+def release_client_color(meta):
+    if meta.get("color_nickname") is not None:
+        _release_nickname_color(meta.pop("color_nickname"))
+
+def allow_message(msg_type, *keys):
+    """Take a token for `msg_type` from the bucket of every key; False if any bucket is empty."""
+    limit = RATE_LIMITS.get(msg_type)
+    if limit is None:
+        return True
+    rate, burst = limit
+    buckets = RATE_BUCKETS.setdefault(msg_type, OrderedDict())
+    now = time.monotonic()
+    # A bucket idle long enough to be full again is the same as no bucket
+    ttl = burst / rate
+    while buckets:
+        oldest = next(iter(buckets.values()))
+        if now - oldest[1] < ttl:
+            break
+        buckets.popitem(last=False)
+    levels = []
+    for key in keys:
+        bucket = buckets.get(key)
+        tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+        levels.append((key, tokens))
+    allowed = all(tokens >= 1 for _, tokens in levels)
+    for key, tokens in levels:
+        buckets[key] = [tokens - 1 if allowed else tokens, now]
+        buckets.move_to_end(key)
+    return allowed
+
+def _read_tail_lines(path, count, block_size=8192):
+    """Return at most the last `count` lines of a file, reading backwards from the end."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return data.splitlines()[-count:]
+
+def _close_chat_journal():
+    global CHAT_JOURNAL
+    if CHAT_JOURNAL is not None:
+        try:
+            CHAT_JOURNAL.close()
+        except Exception:
+            pass
+        CHAT_JOURNAL = None
 
-def save_chat_history():
+def compact_chat_history():
+    """Rewrite the journal so it only holds the in-memory ring."""
+    global CHAT_JOURNAL_LINES
+    _close_chat_journal()
     try:
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump(CHAT_HISTORY, f, ensure_ascii=False, indent=2)
+        temp_file = LOG_FILE + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            for entry in CHAT_HISTORY:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_file, LOG_FILE)
+        CHAT_JOURNAL_LINES = len(CHAT_HISTORY)
     except Exception as e:
-        logging.error(f"Failed to save chat history: {e}")
+        logging.error(f"Failed to compact chat history: {e}")
 
-def load_chat_history():
-    global CHAT_HISTORY
-    if os.path.exists(LOG_FILE):
-        try:
-            with open(LOG_FILE, "r", encoding="utf-8") as f:
-                CHAT_HISTORY = json.load(f)
-                # Keep only last 100
-                if len(CHAT_HISTORY) > MAX_HISTORY:
-                    CHAT_HISTORY = CHAT_HISTORY[-MAX_HISTORY:]
-            logging.info(f"Loaded {len(CHAT_HISTORY)} messages from history.")
-        except Exception as e:
-            logging.error(f"Failed to load chat history: {e}")
+def next_chat_id():
+    """Increasing id for a new chat message, so clients can ask for what's newer.
 
-def save_user_data():
+    Milliseconds since the epoch (kept above any id already seen, in case the
+    clock goes back), with the worker index in the low digits like pids.
+    """
+    global CHAT_LAST_ID
+    chat_id = int(time.time() * 1000) * SERVER_WORKERS + WORKER_INDEX
+    if chat_id <= CHAT_LAST_ID:
+        chat_id = (CHAT_LAST_ID // SERVER_WORKERS + 1) * SERVER_WORKERS + WORKER_INDEX
+    CHAT_LAST_ID = chat_id
+    return chat_id
+
+def append_chat_history(entry):
+    """Add a message to the history ring and append it to the journal (constant cost per message)."""
+    global CHAT_JOURNAL, CHAT_JOURNAL_LINES, CHAT_LAST_ID
+    CHAT_HISTORY.append(entry)
+    CHAT_LAST_ID = max(CHAT_LAST_ID, entry.get("id", 0))
+    HISTORY_FRAMES.clear()
+    if IS_WORKER:
+        return # The broker writes the journal
+    try:
+        if CHAT_JOURNAL is None:
+            CHAT_JOURNAL = open(LOG_FILE, "a", encoding="utf-8")
+        CHAT_JOURNAL.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        CHAT_JOURNAL.flush()
+        CHAT_JOURNAL_LINES += 1
+    except Exception as e:
+        _close_chat_journal()
+        logging.error(f"Failed to append chat history: {e}")
+    if CHAT_JOURNAL_LINES >= CHAT_JOURNAL_COMPACT_LINES:
+        compact_chat_history()
+
+def load_chat_history():
+    global CHAT_LAST_ID
+    source = None
     try:
+        if os.path.exists(LOG_FILE):
+            source = LOG_FILE
+            for line in _read_tail_lines(LOG_FILE, MAX_HISTORY):
+                try:
+                    CHAT_HISTORY.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass # Torn write from a crash
+        elif os.path.exists(OLD_LOG_FILE):
+            # Migrate the old full-rewrite JSON array
+            source = OLD_LOG_FILE
+            with open(OLD_LOG_FILE, "r", encoding="utf-8") as f:
+                CHAT_HISTORY.extend(json.load(f)[-MAX_HISTORY:])
+    except Exception as e:
+        logging.error(f"Failed to load chat history: {e}")
+    CHAT_LAST_ID = max((entry.get("id", 0) for entry in CHAT_HISTORY), default=0)
+    if source:
+        logging.info(f"Loaded {len(CHAT_HISTORY)} messages from {os.path.basename(source)}.")
+        # Start every run with a compact journal so the line count is known
+        compact_chat_history()
+
+def mark_user_dirty(uid):
+    """Queue a user for the next write-behind flush instead of rewriting the file now."""
+    if IS_WORKER:
+        return # The broker persists user data
+    USER_DATA_DIRTY.add(uid)
+    if len(USER_DATA_DIRTY) >= USER_DATA_FLUSH_THRESHOLD and USER_DATA_FLUSH_EVENT is not None:
+        USER_DATA_FLUSH_EVENT.set()
+
+def open_user_db():
+    global USER_DB
+    USER_DB = sqlite3.connect(USER_DB_FILE, check_same_thread=False)
+    USER_DB.execute("PRAGMA journal_mode=WAL")
+    USER_DB.execute("PRAGMA synchronous=NORMAL")
+    USER_DB.execute("""CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        nickname TEXT,
+        tripcode TEXT,
+        playtime REAL NOT NULL DEFAULT 0
+    )""")
+    USER_DB.execute("CREATE INDEX IF NOT EXISTS idx_users_playtime ON users (playtime DESC)")
+    USER_DB.commit()
+
+def _db_write_users(rows):
+    """Upsert (user_id, nickname, tripcode, playtime) rows in one transaction."""
+    with USER_DATA_WRITE_LOCK:
+        USER_DB.executemany(
+            """INSERT INTO users (user_id, nickname, tripcode, playtime) VALUES (?, ?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   nickname = excluded.nickname,
+                   tripcode = excluded.tripcode,
+                   playtime = excluded.playtime""",
+            rows)
+        USER_DB.commit()
+    # Approximate payload size, for comparison with the JSON backend
+    return sum(len(uid) + len(nick or "") + len(trip or "") + 8 for uid, nick, trip, _ in rows)
+
+def _user_rows(uids):
+    rows = []
+    for uid in uids:
+        info = USER_DATA.get(uid)
+        if isinstance(info, dict):
+            rows.append((uid, info.get("nickname"), info.get("tripcode"), info.get("playtime", 0)))
+    return rows
+
+def get_user(uid, create=False):
+    """Return the stored dict for a user, loading it from the database backend on demand."""
+    info = USER_DATA.get(uid)
+    if info is None and USER_DB is not None:
+        with USER_DATA_WRITE_LOCK:
+            row = USER_DB.execute(
+                "SELECT nickname, tripcode, playtime FROM users WHERE user_id = ?", (uid,)).fetchone()
+        if row:
+            info = {"playtime": row[2]}
+            if row[0] is not None: info["nickname"] = row[0]
+            if row[1] is not None: info["tripcode"] = row[1]
+            USER_DATA[uid] = info
+    if info is None and create:
+        info = USER_DATA[uid] = {}
+    return info
+
+def evict_clean_users():
+    """SQLite backend: drop cached users that are neither dirty nor online."""
+    online = {meta.get("user_id") for meta in CLIENTS.values()}
+    for uid in [uid for uid in USER_DATA if uid not in USER_DATA_DIRTY and uid not in online]:
+        del USER_DATA[uid]
+
+def top_playtime(limit=LEADERBOARD_SIZE):
+    """Return up to `limit` (user_id, info) pairs with the highest playtime."""
+    if USER_DB is None:
+        candidates = []
+        for uid, info in USER_DATA.items():
+            # Robust check: info MUST be a dict
+            if isinstance(info, dict) and info.get("playtime", 0) >= 0:
+                candidates.append((uid, info))
+        return sorted(candidates, key=lambda x: x[1].get("playtime", 0), reverse=True)[:limit]
+
+    # Index scan on idx_users_playtime, merged with changes not flushed yet
+    with USER_DATA_WRITE_LOCK:
+        rows = USER_DB.execute(
+            "SELECT user_id, nickname, tripcode, playtime FROM users ORDER BY playtime DESC LIMIT ?",
+            (limit,)).fetchall()
+    merged = {uid: {"nickname": nick, "tripcode": trip, "playtime": playtime} for uid, nick, trip, playtime in rows}
+    for uid in USER_DATA_DIRTY:
+        info = USER_DATA.get(uid)
+        if isinstance(info, dict):
+            merged[uid] = info
+    return sorted(merged.items(), key=lambda x: x[1].get("playtime", 0), reverse=True)[:limit]
+
+def _leaderboard_entry(info):
+    return {"nickname": info.get("nickname"), "tripcode": info.get("tripcode"), "playtime": info.get("playtime", 0)}
+
+def _refresh_leaderboard_floor():
+    global LEADERBOARD_FLOOR
+    LEADERBOARD_FRAMES.clear()
+    if len(LEADERBOARD_TOP) >= LEADERBOARD_SIZE:
+        LEADERBOARD_FLOOR = min(entry["playtime"] for entry in LEADERBOARD_TOP.values())
+    else:
+        LEADERBOARD_FLOOR = 0
+
+def seed_leaderboard():
+    """Fill the leaderboard cache from the store (once, after loading user data)."""
+    LEADERBOARD_TOP.clear()
+    for uid, info in top_playtime(LEADERBOARD_SIZE):
+        LEADERBOARD_TOP[uid] = _leaderboard_entry(info)
+    _refresh_leaderboard_floor()
+
+def update_leaderboard(uid, info):
+    """Apply a playtime or name change for one user to the leaderboard cache."""
+    if uid not in LEADERBOARD_TOP:
+        if len(LEADERBOARD_TOP) >= LEADERBOARD_SIZE and info.get("playtime", 0) <= LEADERBOARD_FLOOR:
+            return
+    LEADERBOARD_TOP[uid] = _leaderboard_entry(info)
+    if len(LEADERBOARD_TOP) > LEADERBOARD_SIZE:
+        del LEADERBOARD_TOP[min(LEADERBOARD_TOP, key=lambda u: LEADERBOARD_TOP[u]["playtime"])]
+    _refresh_leaderboard_floor()
+
+def get_leaderboard_frame(compact=False):
+    """Encoded leaderboard, rebuilt only after the cache changed."""
+    if compact not in LEADERBOARD_FRAMES:
+        # Sorted by playtime descending
+        leaderboard = []
+        for entry in sorted(LEADERBOARD_TOP.values(), key=lambda e: e["playtime"], reverse=True):
+            total_seconds = entry["playtime"]
+            leaderboard.append({
+                "nickname": entry["nickname"] or "Anonymous",
+                "tripcode": entry["tripcode"] or "????",
+                "playtime": format_playtime(total_seconds),
+                "playtime_seconds": total_seconds
+            })
+        LEADERBOARD_FRAMES[compact] = encode_message({"type": "leaderboard", "entries": leaderboard}, compact)
+    return LEADERBOARD_FRAMES[compact]
+
+def add_playtime(uid, delta):
+    info = get_user(uid, create=True)
+    info["playtime"] = info.get("playtime", 0) + delta
+    mark_user_dirty(uid)
+    update_leaderboard(uid, info)
+    return info
+
+def update_user_metadata(uid, nickname, tripcode):
+    if IS_WORKER:
+        # The broker applies it and sends the updated record back ("user")
+        bus_publish({"op": "user_meta", "uid": uid, "nickname": nickname, "tripcode": tripcode})
+        return None
+    info = get_user(uid, create=True)
+    info.update({
+        "nickname": nickname,
+        "tripcode": tripcode
+    })
+    mark_user_dirty(uid)
+    update_leaderboard(uid, info)
+    return info
+
+def credit_playtime(meta, now):
+    """Add the time since the last status update to the user's playtime if they were in game."""
+    if not meta.get("in_game") or "last_status_time" not in meta:
+        return 0
+    uid = meta.get("user_id", "anonymous")
+    if uid == "anonymous":
+        return 0
+    delta = now - meta["last_status_time"]
+    if IS_WORKER:
+        bus_publish({"op": "credit", "uid": uid, "delta": delta}) # Applied by the broker, see user_meta
+    else:
+        add_playtime(uid, delta)
+    return delta
+
+def _write_user_data(data):
+    with USER_DATA_WRITE_LOCK:
         temp_file = USER_DATA_FILE + ".tmp"
-        with open(temp_file, "w", encoding="utf-8") as f:
-            json.dump(USER_DATA, f, ensure_ascii=False, indent=2)
+        with open(temp_file, "wb") as f:
+            f.write(data)
         os.replace(temp_file, USER_DATA_FILE)
+    return len(data)
+
+def _record_flush(started, users, written):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    METRICS["user_data_flushes"] += 1
+    METRICS["user_data_users_flushed"] += users
+    METRICS["user_data_bytes_written"] += written
+    METRICS["user_data_last_flush_ms"] = elapsed_ms
+    METRICS["user_data_max_flush_ms"] = max(METRICS["user_data_max_flush_ms"], elapsed_ms)
+    observe(HISTOGRAMS["user_data_flush_seconds"], elapsed_ms / 1000)
+    logging.debug(f"Flushed {users} dirty users ({written} bytes) in {elapsed_ms:.1f}ms")
+
+def save_user_data():
+    """Synchronously write all user data (migration and final shutdown flush)."""
+    started = time.perf_counter()
+    dirty = set(USER_DATA_DIRTY)
+    USER_DATA_DIRTY.clear()
+    try:
+        if USER_DB is not None:
+            written = _db_write_users(_user_rows(dirty))
+        else:
+            written = _write_user_data(encode_message(USER_DATA))
+        _record_flush(started, len(dirty), written)
     except Exception as e:
+        USER_DATA_DIRTY.update(dirty)
+        METRICS["user_data_flush_errors"] += 1
         logging.error(f"Failed to save user data: {e}")
 
+async def flush_user_data():
+    """Write-behind flush: serialize on the loop, write the file off the loop."""
+    if not USER_DATA_DIRTY:
+        return
+    started = time.perf_counter()
+    dirty = set(USER_DATA_DIRTY)
+    USER_DATA_DIRTY.clear()
+    try:
+        if USER_DB is not None:
+            # Only the dirty rows are written
+            written = await asyncio.to_thread(_db_write_users, _user_rows(dirty))
+        else:
+            payload = encode_message(USER_DATA)
+            written = await asyncio.to_thread(_write_user_data, payload)
+        _record_flush(started, len(dirty), written)
+    except Exception as e:
+        USER_DATA_DIRTY.update(dirty)
+        METRICS["user_data_flush_errors"] += 1
+        logging.error(f"Failed to flush user data: {e}")
+
+async def user_data_flush_loop():
+    """Flush dirty users every USER_DATA_FLUSH_INTERVAL seconds or once the dirty threshold is hit."""
+    while True:
+        try:
+            await asyncio.wait_for(USER_DATA_FLUSH_EVENT.wait(), timeout=USER_DATA_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        USER_DATA_FLUSH_EVENT.clear()
+        await flush_user_data()
+        if USER_STORE == "sqlite":
+            evict_clean_users()
+
 def load_user_data():
     global USER_DATA
+    if USER_STORE == "sqlite":
+        logging.info(f"Opening user database: {USER_DB_FILE}")
+        open_user_db()
+        count = USER_DB.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        if count:
+            logging.info(f"User database holds {count} users.")
+            return
+        logging.info("User database is empty, migrating from JSON files.")
+
     logging.info(f"Loading user data from: {USER_DATA_FILE}")
     # 1. Load existing user_data.json if it exists
     if os.path.exists(USER_DATA_FILE):
@@ -131,324 +659,1005 @@ def load_user_data():
         except Exception as e:
             logging.error(f"Migration error (metadata): {e}")
             
-    if migrated:
+    if USER_DB is not None:
+        # One-shot import; the JSON files are left in place untouched
+        _db_write_users(_user_rows(list(USER_DATA)))
+        logging.info(f"Imported {len(USER_DATA)} users into {USER_DB_FILE}.")
+        USER_DATA.clear()
+        USER_DATA_DIRTY.clear()
+    elif migrated:
         save_user_data()
         logging.info(f"Consolidated data saved to {USER_DATA_FILE}. Migration successful.")
     else:
         logging.info("No migration files found or migration not needed.")
 
-async def broadcast(message):
-    if CLIENTS:
-        await asyncio.gather(*(client.send(message) for client in CLIENTS.keys()), return_exceptions=True)
-
-async def broadcast_player_list():
-    players = []
-    for meta in CLIENTS.values():
-        uid = meta.get("user_id", "anonymous")
-        user_info = USER_DATA.get(uid, {})
-        total_seconds = user_info.get("playtime", 0)
-        
-        # Format playtime string
-        if total_seconds < 60:
-            playtime_str = f"{int(total_seconds)}s"
-        elif total_seconds < 3600:
-            playtime_str = f"{int(total_seconds // 60)}m"
+def compact_keys(payload):
+    if isinstance(payload, dict):
+        return {COMPACT_KEYS.get(key, key): compact_keys(value) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [compact_keys(value) for value in payload]
+    return payload
+
+def encode_message(payload, compact=False):
+    """Serialize an outgoing message to UTF-8 once so the same bytes go to every recipient."""
+    if compact:
+        payload = compact_keys(payload)
+    if JSON_CODEC == "orjson":
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode_message(raw):
+    """Parse an incoming text/bytes frame. Raises json.JSONDecodeError on bad input."""
+    if JSON_CODEC == "orjson":
+        return orjson.loads(raw) # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return json.loads(raw)
+
+async def send_message(websocket, frame, msg_type):
+    """Send a frame from encode_message() to a single client as a text frame."""
+    MESSAGES_OUT[msg_type] = MESSAGES_OUT.get(msg_type, 0) + 1
+    if websocket in SLOW_CLIENTS:
+        enqueue_frame(websocket, frame) # Keep order behind the queued frames
+        return
+    await websocket.send(frame, text=True)
+
+def is_compact(websocket):
+    meta = CLIENTS.get(websocket)
+    return meta is not None and meta.get("compact", False)
+
+def encode_for(websocket, payload):
+    """Encode a message in the format the client negotiated."""
+    return encode_message(payload, is_compact(websocket))
+
+def get_history_frame(compact=False):
+    if compact not in HISTORY_FRAMES:
+        HISTORY_FRAMES[compact] = encode_message({"type": "history", "messages": list(CHAT_HISTORY)}, compact)
+    return HISTORY_FRAMES[compact]
+
+def _write_buffer_size(client):
+    transport = getattr(client, "transport", None)
+    if transport is None:
+        return 0
+    try:
+        return transport.get_write_buffer_size()
+    except Exception:
+        return 0
+
+def _outbox_meta(websocket):
+    meta = CLIENTS.get(websocket)
+    if meta is not None and "outbox" not in meta:
+        meta.update({"outbox": deque(), "outbox_bytes": 0, "roster_stale": False, "over_limit_since": None})
+    return meta
+
+def _start_outbox_writer(websocket, meta):
+    if websocket not in SLOW_CLIENTS:
+        SLOW_CLIENTS.add(websocket)
+        meta["outbox_task"] = asyncio.create_task(drain_outbox(websocket, meta))
+
+def enqueue_frame(websocket, frame):
+    """Queue a frame for a slow client; dropped if its outbox is at OUTBOX_MAX_BYTES."""
+    meta = _outbox_meta(websocket)
+    if meta is None:
+        return
+    if meta["outbox_bytes"] + len(frame) > OUTBOX_MAX_BYTES:
+        METRICS["outbox_frames_dropped"] += 1
+        if meta["over_limit_since"] is None:
+            meta["over_limit_since"] = time.monotonic()
+    else:
+        meta["outbox"].append(frame)
+        meta["outbox_bytes"] += len(frame)
+        meta["over_limit_since"] = None
+        METRICS["outbox_frames_queued"] += 1
+    _start_outbox_writer(websocket, meta)
+
+def mark_roster_stale(websocket):
+    """Replace queued-up roster updates for a slow client with one snapshot after it drains."""
+    meta = _outbox_meta(websocket)
+    if meta is None:
+        return
+    meta["roster_stale"] = True
+    METRICS["roster_frames_coalesced"] += 1
+    _start_outbox_writer(websocket, meta)
+
+def roster_snapshot_frames(compact=False):
+    return [
+        encode_message({"type": "user_count", "count": len(CLIENTS) + len(REMOTE_PLAYERS)}, compact),
+        encode_message(player_list_message(), compact),
+        encode_message(lobby_list_message(), compact),
+    ]
+
+async def drain_outbox(websocket, meta):
+    """Send a slow client's queued frames at the pace it reads them."""
+    outbox = meta["outbox"]
+    try:
+        while outbox or meta["roster_stale"]:
+            if outbox:
+                frame = outbox[0]
+                await websocket.send(frame, text=True)
+                outbox.popleft()
+                meta["outbox_bytes"] -= len(frame)
+                meta["over_limit_since"] = None # Back under the cap
+            else:
+                meta["roster_stale"] = False
+                for frame in roster_snapshot_frames(meta.get("compact", False)):
+                    await websocket.send(frame, text=True)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        SLOW_CLIENTS.discard(websocket)
+        meta["over_limit_since"] = None
+        meta.pop("outbox_task", None)
+
+async def slow_client_monitor():
+    """Disconnect clients whose outbox has been full, without draining, for longer than SLOW_CLIENT_TIMEOUT."""
+    while True:
+        await asyncio.sleep(1)
+        now = time.monotonic()
+        for websocket in list(SLOW_CLIENTS):
+            meta = CLIENTS.get(websocket)
+            since = meta.get("over_limit_since") if meta else None
+            if since is not None and now - since > SLOW_CLIENT_TIMEOUT:
+                logging.warning(f"Disconnecting slow client {meta['nickname']}: outbox full for {now - since:.0f}s")
+                METRICS["slow_clients_disconnected"] += 1
+                SLOW_CLIENTS.discard(websocket)
+                websocket.transport.abort()
+
+def broadcast(message, clients=None, msg_type=None, roster=False):
+    """Fan out one encoded frame to all clients (or `clients`) without awaiting each send.
+
+    Accepts a payload dict (encoded at most once per format: full keys and
+    compact) or a frame from encode_message() that goes to everyone as is
+    (then pass msg_type for the metrics). Clients whose transport buffer is
+    above BROADCAST_HIGH_WATER get the frame through their outbox instead,
+    or, for roster frames, a snapshot once they catch up.
+    """
+    if clients is None:
+        clients = CLIENTS
+    if not clients:
+        return
+    started = time.perf_counter()
+    if isinstance(message, dict):
+        msg_type = message.get("type")
+        frames = {}
+    else:
+        frames = {False: message, True: message}
+
+    def frame_for(compact):
+        if compact not in frames:
+            frames[compact] = encode_message(message, compact)
+        return frames[compact]
+
+    groups = ([], []) # full keys, compact
+    for client in clients:
+        compact = is_compact(client)
+        if client in SLOW_CLIENTS or _write_buffer_size(client) > BROADCAST_HIGH_WATER:
+            if roster:
+                mark_roster_stale(client)
+            else:
+                enqueue_frame(client, frame_for(compact))
         else:
-            playtime_str = f"{total_seconds / 3600:.1f}h"
+            groups[compact].append(client)
+    sent = 0
+    for compact, recipients in enumerate(groups):
+        if recipients:
+            frame = frame_for(bool(compact))
+            websockets.broadcast(recipients, frame, text=True)
+            sent += len(recipients)
+            METRICS["broadcast_bytes"] += len(frame) * len(recipients)
+    observe(HISTOGRAMS["broadcast_seconds"], time.perf_counter() - started)
+    observe(HISTOGRAMS["broadcast_recipients"], sent)
+    MESSAGES_OUT[msg_type] = MESSAGES_OUT.get(msg_type, 0) + sent
+    METRICS["broadcast_frames"] += 1
+    METRICS["broadcast_recipients"] += sent
 
-        players.append({
-            "nickname": meta["nickname"],
-            "modpack": meta["modpack"],
-            "in_game": meta.get("in_game", False),
-            "game_mode": meta.get("game_mode", "Online"),
-            "color": meta["color"],
-            "tripcode": meta.get("tripcode", ""),
-            "playtime": playtime_str
-        })
-    await broadcast(json.dumps({"type": "player_list", "players": players}, ensure_ascii=False))
+def format_playtime(total_seconds):
+    if total_seconds < 60:
+        return f"{int(total_seconds)}s"
+    elif total_seconds < 3600:
+        return f"{int(total_seconds // 60)}m"
+    return f"{total_seconds / 3600:.1f}h"
 
-async def broadcast_lobby_list():
+def build_player_entry(meta):
+    uid = meta.get("user_id", "anonymous")
+    user_info = get_user(uid) or {}
+    return {
+        "id": meta["pid"],
+        "nickname": meta["nickname"],
+        "modpack": meta["modpack"],
+        "in_game": meta.get("in_game", False),
+        "game_mode": meta.get("game_mode", "Online"),
+        "color": meta["color"],
+        "tripcode": meta.get("tripcode", ""),
+        "playtime": format_playtime(user_info.get("playtime", 0))
+    }
+
+def player_list_message():
+    """Full roster snapshot matching ROSTER_SEQ."""
+    return {"type": "player_list", "players": list(ROSTER_PUBLISHED.values()), "seq": ROSTER_SEQ}
+
+def lobby_list_message():
     lobbies = []
-    for meta in LOBBIES.values():
+    for meta in itertools.chain(LOBBIES.values(), REMOTE_LOBBIES.values()):
         lobbies.append({
             "nickname": meta["nickname"],
             "password": meta["password"],
             "color": meta["color"]
         })
-    await broadcast(json.dumps({"type": "lobby_list", "lobbies": lobbies}, ensure_ascii=False))
+    return {"type": "lobby_list", "lobbies": lobbies}
+
+def _collect_roster_deltas(pids):
+    """Diff the given players against ROSTER_PUBLISHED and number the resulting deltas."""
+    global ROSTER_SEQ
+    deltas = []
+    for pid in pids:
+        websocket = PLAYERS_BY_PID.get(pid)
+        entry = build_player_entry(CLIENTS[websocket]) if websocket in CLIENTS else REMOTE_PLAYERS.get(pid)
+        old_entry = ROSTER_PUBLISHED.get(pid)
+        if entry == old_entry:
+            continue
+        ROSTER_SEQ += 1
+        if entry is None:
+            del ROSTER_PUBLISHED[pid]
+            deltas.append({"type": "player_leave", "seq": ROSTER_SEQ, "id": pid})
+        else:
+            ROSTER_PUBLISHED[pid] = entry
+            delta_type = "player_join" if old_entry is None else "player_update"
+            deltas.append({"type": delta_type, "seq": ROSTER_SEQ, "player": entry})
+    return deltas
+
+def schedule_roster_update(pids=(), lobbies=False, count=False):
+    """Queue roster/lobby/user count changes for the next coalesced update."""
+    global PENDING_LOBBIES, PENDING_USER_COUNT, ROSTER_FLUSH_HANDLE
+    METRICS["roster_changes"] += 1
+    PENDING_ROSTER_PIDS.update(pids)
+    PENDING_LOBBIES = PENDING_LOBBIES or lobbies
+    PENDING_USER_COUNT = PENDING_USER_COUNT or count
+    if ROSTER_COALESCE_WINDOW <= 0:
+        flush_roster_updates()
+    elif ROSTER_FLUSH_HANDLE is None:
+        ROSTER_FLUSH_HANDLE = asyncio.get_running_loop().call_later(ROSTER_COALESCE_WINDOW, flush_roster_updates)
+
+def flush_roster_updates():
+    """Send everything collected in the current window as one update per client.
+
+    Clients with the "batch" capability get a single batch frame; delta
+    clients get user_count, the roster deltas and lobby_list; legacy clients
+    get user_count, a full player_list and lobby_list, each at most once.
+    """
+    global PENDING_LOBBIES, PENDING_USER_COUNT, ROSTER_FLUSH_HANDLE
+    ROSTER_FLUSH_HANDLE = None
+    deltas = _collect_roster_deltas(PENDING_ROSTER_PIDS)
+    PENDING_ROSTER_PIDS.clear()
+    if BUS is not None:
+        # Share changes to our own players with the other workers
+        local_changes = {}
+        for delta in deltas:
+            pid = delta["id"] if delta["type"] == "player_leave" else delta["player"]["id"]
+            if pid % SERVER_WORKERS == WORKER_INDEX:
+                local_changes[pid] = delta.get("player")
+        if local_changes:
+            bus_publish({"op": "roster", "players": local_changes})
+    common = []
+    if PENDING_USER_COUNT:
+        common.append({"type": "user_count", "count": len(CLIENTS) + len(REMOTE_PLAYERS)})
+    lobby_message = lobby_list_message() if PENDING_LOBBIES else None
+    PENDING_LOBBIES = PENDING_USER_COUNT = False
+    METRICS["roster_flushes"] += 1
+    METRICS["roster_deltas_sent"] += len(deltas)
+
+    delta_messages = common + deltas + ([lobby_message] if lobby_message else [])
+    legacy_messages = common + ([player_list_message()] if deltas else []) + ([lobby_message] if lobby_message else [])
+    if not delta_messages:
+        return
+
+    batch_clients = []
+    delta_clients = []
+    legacy_clients = []
+    for client, meta in CLIENTS.items():
+        caps = meta.get("caps", ())
+        if ROSTER_DELTA_CAP not in caps:
+            legacy_clients.append(client)
+        elif ROSTER_BATCH_CAP in caps:
+            batch_clients.append(client)
+        else:
+            delta_clients.append(client)
+    broadcast({"type": "batch", "messages": delta_messages}, batch_clients, roster=True)
+    for message in delta_messages:
+        broadcast(message, delta_clients, roster=True)
+    for message in legacy_messages:
+        broadcast(message, legacy_clients, roster=True)
+
+def post_chat(chat_entry):
+    """Store a chat message and send it to everyone (and to the other workers)."""
+    # Persistent Save (journal append, compacted periodically)
+    append_chat_history(chat_entry)
+    # Broadcast to all
+    broadcast({"type": "chat", **chat_entry})
+    bus_publish({"op": "chat", "entry": chat_entry})
+
+def set_lobby(websocket, lobby):
+    """Host (lobby dict) or remove (None) the lobby of a local client. Returns True if anything changed."""
+    if lobby is None:
+        if LOBBIES.pop(websocket, None) is None:
+            return False
+    else:
+        LOBBIES[websocket] = lobby
+    pid = CLIENTS[websocket]["pid"] if websocket in CLIENTS else None
+    if pid is not None:
+        bus_publish({"op": "lobby", "lobbies": {pid: lobby}})
+    return True
+
+# --- Metrics (ER_METRICS_PORT / ER_METRICS_DUMP_INTERVAL) ---
+
+def record_handler_cpu(msg_type, cpu_seconds):
+    stats = HANDLER_CPU.setdefault(msg_type, [0, 0.0])
+    stats[0] += 1
+    stats[1] += cpu_seconds
+
+@types.coroutine
+def cpu_timed(coro, cpu):
+    """Await `coro`, adding the thread CPU time of its own steps to cpu[0].
+
+    All tasks share the loop thread, so time.thread_time() around a plain
+    await would also bill whatever other tasks ran while `coro` was
+    suspended (e.g. in a send); only the time between resuming it and its
+    next suspension is counted here.
+    """
+    value, error = None, None
+    while True:
+        started = time.thread_time()
+        try:
+            yielded = coro.send(value) if error is None else coro.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            cpu[0] += time.thread_time() - started
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
+
+async def loop_lag_monitor():
+    """Measure how late a LOOP_LAG_INTERVAL sleep wakes up, i.e. how long callbacks block the loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - started - LOOP_LAG_INTERVAL)
+        observe(HISTOGRAMS["event_loop_lag_seconds"], lag)
+        METRICS["event_loop_lag_last_ms"] = lag * 1000
+        METRICS["event_loop_lag_max_ms"] = max(METRICS["event_loop_lag_max_ms"], lag * 1000)
+
+def metrics_snapshot():
+    return {
+        "time": time.time(),
+        "role": SERVER_ROLE,
+        "worker": WORKER_INDEX,
+        "connected_clients": len(CLIENTS),
+        "remote_players": len(REMOTE_PLAYERS),
+        "lobbies": len(LOBBIES) + len(REMOTE_LOBBIES),
+        "cached_users": len(USER_DATA),
+        "dirty_users": len(USER_DATA_DIRTY),
+        "rate_limit_buckets": sum(len(b) for b in RATE_BUCKETS.values()),
+        "nickname_colors": len(NICKNAME_COLOR_MAP),
+        "slow_clients": len(SLOW_CLIENTS),
+        "outbox_bytes": sum(CLIENTS[ws]["outbox_bytes"] for ws in SLOW_CLIENTS if ws in CLIENTS),
+        "counters": dict(METRICS),
+        "messages_in": dict(MESSAGES_IN),
+        "messages_out": dict(MESSAGES_OUT),
+        "handler_cpu": {t: {"calls": calls, "cpu_seconds": cpu} for t, (calls, cpu) in HANDLER_CPU.items()},
+        "histograms": {name: {"buckets": list(h["buckets"]), "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                       for name, h in HISTOGRAMS.items()},
+    }
+
+def _prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    labels = f'role="{SERVER_ROLE}",worker="{WORKER_INDEX}"'
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP er_{name} {help_text}")
+        lines.append(f"# TYPE er_{name} {kind}")
+        for extra, value in samples:
+            lines.append(f"er_{name}{{{labels}{extra}}} {value}")
+
+    metric("connected_clients", "gauge", "Clients connected to this process.", [("", len(CLIENTS))])
+    metric("remote_players", "gauge", "Players connected to other workers.", [("", len(REMOTE_PLAYERS))])
+    metric("lobbies", "gauge", "Hosted lobbies.", [("", len(LOBBIES) + len(REMOTE_LOBBIES))])
+    metric("cached_users", "gauge", "User records held in memory.", [("", len(USER_DATA))])
+    metric("dirty_users", "gauge", "Users waiting for the next flush.", [("", len(USER_DATA_DIRTY))])
+    metric("rate_limit_buckets", "gauge", "Live token buckets by message type.",
+           [(f',type="{_prometheus_label(t)}"', len(b)) for t, b in sorted(RATE_BUCKETS.items())])
+    metric("nickname_colors", "gauge", "Nicknames holding a color.", [("", len(NICKNAME_COLOR_MAP))])
+    metric("slow_clients", "gauge", "Clients currently served through their outbox.", [("", len(SLOW_CLIENTS))])
+    metric("outbox_bytes", "gauge", "Bytes queued in slow clients' outboxes.",
+           [("", sum(CLIENTS[ws]["outbox_bytes"] for ws in SLOW_CLIENTS if ws in CLIENTS))])
+    for key, value in METRICS.items():
+        if key.endswith("_ms"):
+            metric(key, "gauge", key.replace("_", " ") + ".", [("", value)])
+        else:
+            metric(key + "_total", "counter", key.replace("_", " ") + ".", [("", value)])
+    metric("messages_in_total", "counter", "Messages received from clients by type.",
+           [(f',type="{_prometheus_label(t)}"', n) for t, n in sorted(MESSAGES_IN.items())])
+    metric("messages_out_total", "counter", "Frames sent to clients by type (one per recipient).",
+           [(f',type="{_prometheus_label(t)}"', n) for t, n in sorted(MESSAGES_OUT.items(), key=lambda i: str(i[0]))])
+    metric("handler_calls_total", "counter", "Client messages handled by type.",
+           [(f',type="{_prometheus_label(t)}"', calls) for t, (calls, _) in sorted(HANDLER_CPU.items())])
+    metric("handler_cpu_seconds_total", "counter", "CPU time spent handling client messages by type.",
+           [(f',type="{_prometheus_label(t)}"', f"{cpu:.6f}") for t, (_, cpu) in sorted(HANDLER_CPU.items())])
+    for name, h in HISTOGRAMS.items():
+        samples = []
+        cumulative = 0
+        for bound, count in zip(h["buckets"], h["counts"]):
+            cumulative += count
+            samples.append((f',le="{bound}"', cumulative))
+        samples.append((',le="+Inf"', h["count"]))
+        lines.append(f"# HELP er_{name} {name.replace('_', ' ')}.")
+        lines.append(f"# TYPE er_{name} histogram")
+        for extra, value in samples:
+            lines.append(f"er_{name}_bucket{{{labels}{extra}}} {value}")
+        lines.append(f"er_{name}_sum{{{labels}}} {h['sum']:.6f}")
+        lines.append(f"er_{name}_count{{{labels}}} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+async def handle_metrics_request(reader, writer):
+    """Minimal HTTP/1.0 responder for GET /metrics and GET /metrics.json."""
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        parts = request.split(b" ", 2)
+        path = parts[1].decode("latin-1") if len(parts) > 1 else ""
+        if path == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4", render_prometheus().encode("utf-8")
+        elif path == "/metrics.json":
+            status, content_type, body = "200 OK", "application/json", encode_message(metrics_snapshot())
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def _write_metrics_dump(payload):
+    temp_file = METRICS_DUMP_FILE + ".tmp"
+    with open(temp_file, "wb") as f:
+        f.write(payload)
+    os.replace(temp_file, METRICS_DUMP_FILE)
+
+async def metrics_dump_loop():
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            await asyncio.to_thread(_write_metrics_dump, encode_message(metrics_snapshot()))
+        except Exception as e:
+            logging.error(f"Failed to write metrics dump: {e}")
+
+# --- Multi-process bus (ER_SERVER_WORKERS > 1) ---
+# Newline-delimited JSON over a Unix socket. Workers send their state changes
+# (chat, roster, lobby, credit, user_meta) to the broker, which relays them to
+# the other workers, persists them, and answers credit/user_meta with the
+# authoritative user record ("user") so every worker's view and leaderboard agree.
+
+def _bus_write(writer, message):
+    writer.write(encode_message(message) + b"\n")
+    METRICS["bus_messages_out"] += 1
+
+def bus_publish(message):
+    """Worker: send a state change to the broker (no-op in single-process mode)."""
+    if BUS is not None:
+        _bus_write(BUS, message)
+
+async def _bus_messages(reader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        METRICS["bus_messages_in"] += 1
+        yield line, decode_message(line)
+
+def apply_remote_players(players):
+    """Apply {pid: entry or None} roster changes from other workers."""
+    pids = []
+    membership_changed = False
+    for pid, entry in players.items():
+        pid = int(pid)
+        if entry is None:
+            membership_changed |= REMOTE_PLAYERS.pop(pid, None) is not None
+        else:
+            membership_changed |= pid not in REMOTE_PLAYERS
+            REMOTE_PLAYERS[pid] = entry
+        pids.append(pid)
+    return pids, membership_changed
+
+def apply_remote_lobbies(lobbies):
+    for pid, lobby in lobbies.items():
+        if lobby is None:
+            REMOTE_LOBBIES.pop(int(pid), None)
+        else:
+            REMOTE_LOBBIES[int(pid)] = lobby
+
+def apply_remote_user(uid, info):
+    old_info = USER_DATA.get(uid)
+    USER_DATA[uid] = info
+    update_leaderboard(uid, info)
+    if old_info is None or format_playtime(old_info.get("playtime", 0)) != format_playtime(info.get("playtime", 0)):
+        # Our players' roster entries show this playtime
+        pids = [meta["pid"] for meta in CLIENTS.values() if meta.get("user_id") == uid]
+        if pids:
+            schedule_roster_update(pids)
+
+def apply_sync(message):
+    """Worker: take the broker's shared state on joining the bus."""
+    LEADERBOARD_TOP.clear()
+    LEADERBOARD_TOP.update(message.get("leaderboard", {}))
+    _refresh_leaderboard_floor()
+    CHAT_HISTORY.clear()
+    for entry in message.get("history", []):
+        append_chat_history(entry)
+    apply_remote_lobbies(message.get("lobbies", {}))
+    pids, _ = apply_remote_players(message.get("players", {}))
+    return pids
+
+def apply_bus_message(message):
+    """Worker: apply a message relayed by the broker."""
+    op = message.get("op")
+    if op == "chat":
+        append_chat_history(message["entry"])
+        broadcast({"type": "chat", **message["entry"]})
+    elif op == "roster":
+        pids, membership_changed = apply_remote_players(message["players"])
+        schedule_roster_update(pids, count=membership_changed)
+    elif op == "lobby":
+        apply_remote_lobbies(message["lobbies"])
+        schedule_roster_update(lobbies=True)
+    elif op == "user":
+        apply_remote_user(message["uid"], message["info"])
+    elif op == "sync":
+        schedule_roster_update(apply_sync(message), lobbies=True, count=True)
+
+async def connect_bus(stop):
+    """Worker: connect to the broker and apply relayed messages until it goes away."""
+    global BUS
+    reader, BUS = await asyncio.open_unix_connection(BUS_PATH, limit=BUS_READ_LIMIT)
+    _bus_write(BUS, {"op": "hello", "worker": WORKER_INDEX})
+    # Wait for the sync, so our first clients get the current history and leaderboard
+    messages = _bus_messages(reader)
+    async for _, message in messages:
+        apply_bus_message(message)
+        if message.get("op") == "sync":
+            break
+    else:
+        raise ConnectionError("Bus broker closed the connection before syncing.")
+
+    async def pump():
+        global BUS
+        try:
+            async for _, message in messages:
+                try:
+                    apply_bus_message(message)
+                except Exception as e:
+                    logging.error(f"Failed to apply bus message {message.get('op')}: {e}")
+        finally:
+            BUS = None
+            if not stop.done():
+                logging.error("Lost connection to the bus broker, stopping worker.")
+                stop.set_result(None)
+
+    return asyncio.create_task(pump())
+
+def _bus_send_workers(line, exclude=None):
+    for index, writer in list(BUS_WORKERS.items()):
+        if index != exclude:
+            writer.write(line)
+            METRICS["bus_messages_out"] += 1
+
+async def handle_bus_worker(reader, writer):
+    """Broker: persist and relay the state changes of one worker."""
+    index = None
+    try:
+        async for line, message in _bus_messages(reader):
+            op = message.get("op")
+            if op == "hello":
+                index = message["worker"]
+                BUS_WORKERS[index] = writer
+                logging.info(f"Worker {index} joined the bus.")
+                # Everything the worker shares; user records follow as they change
+                _bus_write(writer, {"op": "sync", "players": REMOTE_PLAYERS, "lobbies": REMOTE_LOBBIES,
+                                    "leaderboard": LEADERBOARD_TOP, "history": list(CHAT_HISTORY)})
+            elif op == "credit":
+                info = add_playtime(message["uid"], message["delta"])
+                _bus_send_workers(encode_message({"op": "user", "uid": message["uid"], "info": info}) + b"\n")
+            elif op == "user_meta":
+                info = update_user_metadata(message["uid"], message["nickname"], message["tripcode"])
+                _bus_send_workers(encode_message({"op": "user", "uid": message["uid"], "info": info}) + b"\n")
+            else:
+                if op == "chat":
+                    append_chat_history(message["entry"])
+                elif op == "roster":
+                    apply_remote_players(message["players"])
+                elif op == "lobby":
+                    apply_remote_lobbies(message["lobbies"])
+                _bus_send_workers(line, exclude=index)
+    except Exception as e:
+        logging.error(f"Bus connection to worker {index} failed: {e}")
+    finally:
+        if index is not None and BUS_WORKERS.get(index) is writer:
+            del BUS_WORKERS[index]
+            # Everyone connected to that worker is gone
+            gone = [pid for pid in REMOTE_PLAYERS if pid % SERVER_WORKERS == index]
+            gone_lobbies = [pid for pid in REMOTE_LOBBIES if pid % SERVER_WORKERS == index]
+            for pid in gone:
+                del REMOTE_PLAYERS[pid]
+            for pid in gone_lobbies:
+                del REMOTE_LOBBIES[pid]
+            logging.warning(f"Worker {index} left the bus, dropping {len(gone)} players.")
+            if gone:
+                _bus_send_workers(encode_message({"op": "roster", "players": {pid: None for pid in gone}}) + b"\n")
+            if gone_lobbies:
+                _bus_send_workers(encode_message({"op": "lobby", "lobbies": {pid: None for pid in gone_lobbies}}) + b"\n")
+        writer.close()
+
+async def run_broker(stop):
+    """Broker: run the bus and keep SERVER_WORKERS worker processes alive until stop."""
+    if os.path.exists(BUS_PATH):
+        os.unlink(BUS_PATH)
+    handlers = set()
+
+    async def on_worker(reader, writer):
+        handlers.add(asyncio.current_task())
+        try:
+            await handle_bus_worker(reader, writer)
+        finally:
+            handlers.discard(asyncio.current_task())
+
+    bus_server = await asyncio.start_unix_server(on_worker, path=BUS_PATH, limit=BUS_READ_LIMIT)
+    worker_env = dict(os.environ, ER_SERVER_ROLE="worker", ER_BUS_PATH=BUS_PATH)
+    workers = {}
+
+    def spawn(index):
+        workers[index] = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                          env=dict(worker_env, ER_WORKER_INDEX=str(index)))
+
+    for index in range(SERVER_WORKERS):
+        spawn(index)
+    logging.info(f"Broker started {SERVER_WORKERS} workers on port {SERVER_PORT} (bus: {BUS_PATH})")
+    try:
+        while not stop.done():
+            await asyncio.wait([stop], timeout=1)
+            for index, proc in workers.items():
+                if proc.poll() is not None and not stop.done():
+                    logging.error(f"Worker {index} exited with code {proc.returncode}, restarting.")
+                    spawn(index)
+    finally:
+        for proc in workers.values():
+            proc.terminate()
+        for proc in workers.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if handlers:
+            # Let the handlers see the workers' EOF and clean up
+            await asyncio.wait(handlers, timeout=5)
+        bus_server.close()
+        if os.path.exists(BUS_PATH):
+            os.unlink(BUS_PATH)
+
+@functools.lru_cache(maxsize=16384)
+def get_tripcode(user_id):
+    return hashlib.sha256(user_id.encode()).hexdigest()[:4]
+
+# --- Client message dispatch ---
+# Every client message type maps to a handler coroutine plus a validator compiled
+# from its schema (field name -> allowed type). Fields are optional, as the
+# handlers use defaults, but a present field of the wrong type rejects the message.
+
+MESSAGE_HANDLERS = {} # message type: (handler, validator)
+
+def compile_schema(fields):
+    checks = tuple(fields.items())
+
+    def validate(data):
+        """Return the name of the first field with a wrong type, or None."""
+        for key, expected in checks:
+            value = data.get(key)
+            if value is not None and not isinstance(value, expected):
+                return key
+        return None
+    return validate
+
+def message_handler(msg_type, **schema):
+    """Register the decorated coroutine as the handler for `msg_type` messages."""
+    validator = compile_schema(schema)
+
+    def register(func):
+        MESSAGE_HANDLERS[msg_type] = (func, validator)
+        return func
+    return register
+
+@message_handler("hello", caps=list)
+async def handle_hello(websocket, data):
+    # Capability handshake from newer launchers
+    caps = data.get("caps", [])
+    CLIENTS[websocket]["caps"] = tuple(c for c in caps if isinstance(c, str)) if isinstance(caps, list) else ()
+    CLIENTS[websocket]["compact"] = COMPACT_CAP in CLIENTS[websocket]["caps"]
+    if ROSTER_DELTA_CAP in CLIENTS[websocket]["caps"]:
+        await send_message(websocket, encode_for(websocket, player_list_message()), "player_list")
+
+@message_handler("status_update", nickname=str, modpack=str, in_game=bool, game_mode=str, user_id=str)
+async def handle_status_update(websocket, data):
+    nick = data.get("nickname", "Unknown")
+    mod = data.get("modpack", "Vanilla")
+    in_game = data.get("in_game", False)
+    game_mode = data.get("game_mode", "Online")
+    user_id = data.get("user_id", "anonymous")
+
+    # Playtime logic: calculate delta if they WERE in game
+    now = time.time()
+    old_meta = CLIENTS[websocket]
+    if old_meta.get("in_game") and "last_status_time" in old_meta:
+        delta = credit_playtime(old_meta, now)
+        if delta:
+            uid = old_meta.get("user_id", "anonymous")
+            logging.debug(f"[PLAYTIME] User {nick} ({uid[:8]}): +{delta:.1f}s (was in_game, now: {in_game})")
+    else:
+        logging.debug(f"[PLAYTIME] User {nick}: No time added (in_game: {old_meta.get('in_game', False)} -> {in_game})")
+
+    tripcode = get_tripcode(user_id)
+    color = get_nickname_color(CLIENTS[websocket], nick)
+    CLIENTS[websocket].update({
+        "nickname": nick,
+        "modpack": mod,
+        "in_game": in_game,
+        "game_mode": game_mode,
+        "color": color,
+        "tripcode": tripcode,
+        "user_id": user_id,
+        "last_status_time": now
+    })
+
+    # Update metadata
+    if user_id != "anonymous":
+        update_user_metadata(user_id, nick, tripcode)
+
+    # Auto-remove lobby if player is no longer in-game
+    if not in_game and websocket in LOBBIES:
+        logging.info(f"Removing lobby for {nick} - game exited.")
+        set_lobby(websocket, None)
+        schedule_roster_update(lobbies=True)
+
+    schedule_roster_update([CLIENTS[websocket]["pid"]])
+
+@message_handler("chat", message=str, nickname=str, user_id=str, modpack=str, in_game=bool, game_mode=str)
+async def handle_chat(websocket, data):
+    msg_text = data.get("message", "")
+    nick = data.get("nickname", "Unknown")
+
+    # 1. Length Limit
+    if len(msg_text) > MAX_MESSAGE_LENGTH:
+        msg_text = msg_text[:MAX_MESSAGE_LENGTH]
+
+    # 2. Rate limiting happens in handle_client (RATE_LIMITS)
+    now = time.time()
+
+    # Refresh metadata on every message to ensure player list is accurate
+    color = get_nickname_color(CLIENTS[websocket], nick)
+    user_id = data.get("user_id", "anonymous")
+    tripcode = get_tripcode(user_id)
+
+    # Update metadata but KEEP tracking info
+    old_meta = CLIENTS[websocket]
+    # Update playtime on chat as well
+    credit_playtime(old_meta, now)
+
+    CLIENTS[websocket].update({
+        "nickname": nick,
+        "modpack": data.get("modpack", old_meta["modpack"]),
+        "in_game": data.get("in_game", old_meta["in_game"]),
+        "game_mode": data.get("game_mode", old_meta["game_mode"]),
+        "color": color,
+        "tripcode": tripcode,
+        "user_id": user_id,
+        "last_status_time": now
+    })
+
+    # Store in history
+    chat_entry = {
+        "id": next_chat_id(),
+        "nickname": nick,
+        "message": msg_text,
+        "time": time.strftime("%H:%M"),
+        "color": color,
+        "tripcode": tripcode
+    }
+    post_chat(chat_entry)
+
+@message_handler("request_history")
+async def handle_request_history(websocket, data):
+    # Send history to the requester only
+    if CHAT_HISTORY:
+        await send_message(websocket, get_history_frame(is_compact(websocket)), "history")
+
+@message_handler("request_player_list")
+async def handle_request_player_list(websocket, data):
+    # Send player list to the requester only
+    await send_message(websocket, encode_for(websocket, player_list_message()), "player_list")
+
+@message_handler("host_lobby", password=str)
+async def handle_host_lobby(websocket, data):
+    password = data.get("password", "")
+    if password:
+        meta = CLIENTS.get(websocket, {})
+        set_lobby(websocket, {
+            "password": password,
+            "nickname": meta.get("nickname", "Unknown"),
+            "color": meta.get("color", "gray")
+        })
+        logging.info(f"Lobby hosted by {LOBBIES[websocket]['nickname']} with pass: {password}")
+        schedule_roster_update(lobbies=True)
+
+@message_handler("request_lobbies")
+async def handle_request_lobbies(websocket, data):
+    await send_message(websocket, encode_for(websocket, lobby_list_message()), "lobby_list")
+
+@message_handler("request_leaderboard")
+async def handle_request_leaderboard(websocket, data):
+    logging.debug(f"Leaderboard requested. Serving {len(LEADERBOARD_TOP)} cached entries.")
+    await send_message(websocket, get_leaderboard_frame(is_compact(websocket)), "leaderboard")
 
 async def handle_client(websocket, path=None):
     ip = websocket.remote_address[0]
     logging.info(f"New client connected: {ip}")
+    pid = next(PLAYER_IDS) * SERVER_WORKERS + WORKER_INDEX # Unique across workers
     CLIENTS[websocket] = {
-        "nickname": "Unknown", 
-        "modpack": "Vanilla", 
-        "in_game": False, 
-        "game_mode": "Online", 
+        "pid": pid,
+        "caps": (),
+        "nickname": "Unknown",
+        "modpack": "Vanilla",
+        "in_game": False,
+        "game_mode": "Online",
         "color": "gray"
     }
-    
+    PLAYERS_BY_PID[pid] = websocket
+
     # Broadcast new user count and list
-    await broadcast(json.dumps({"type": "user_count", "count": len(CLIENTS)}, ensure_ascii=False))
-    await broadcast_player_list()
-    
+    schedule_roster_update([pid], count=True)
+
     # Send history to new client
     if CHAT_HISTORY:
-        history_payload = json.dumps({"type": "history", "messages": CHAT_HISTORY}, ensure_ascii=False)
-        await websocket.send(history_payload)
-        
-    # Send lobby list to new client
-    await broadcast_lobby_list()
-        
-    first_message = True
-    
+        await send_message(websocket, get_history_frame(is_compact(websocket)), "history")
+
+    # Send lobby list to new client (nothing changed for everyone else)
+    await send_message(websocket, encode_for(websocket, lobby_list_message()), "lobby_list")
+
     try:
         async for message in websocket:
+            msg_type = "invalid"
+            cpu = [0.0]
+            cpu_started = time.thread_time() # Decode and validation, up to the handler
             try:
-                data = json.loads(message)
-                
-                if data.get("type") == "status_update":
-                    nick = data.get("nickname", "Unknown")
-                    mod = data.get("modpack", "Vanilla")
-                    in_game = data.get("in_game", False)
-                    game_mode = data.get("game_mode", "Online")
-                    user_id = data.get("user_id", "anonymous")
-                    
-                    # Playtime logic: calculate delta if they WERE in game
-                    now = time.time()
-                    old_meta = CLIENTS[websocket]
-                    if old_meta.get("in_game") and "last_status_time" in old_meta:
-                        delta = now - old_meta["last_status_time"]
-                        uid = old_meta.get("user_id", "anonymous")
-                        if uid != "anonymous":
-                            if uid not in USER_DATA: USER_DATA[uid] = {}
-                            USER_DATA[uid]["playtime"] = USER_DATA[uid].get("playtime", 0) + delta
-                            logging.info(f"[PLAYTIME] User {nick} ({uid[:8]}): +{delta:.1f}s (was in_game, now: {in_game})")
-                            save_user_data()
-                    else:
-                        logging.debug(f"[PLAYTIME] User {nick}: No time added (in_game: {old_meta.get('in_game', False)} -> {in_game})")
-
-                    tripcode = hashlib.sha256(user_id.encode()).hexdigest()[:4]
-                    color = get_nickname_color(nick)
-                    CLIENTS[websocket] = {
-                        "nickname": nick, 
-                        "modpack": mod, 
-                        "in_game": in_game, 
-                        "game_mode": game_mode, 
-                        "color": color,
-                        "tripcode": tripcode,
-                        "user_id": user_id,
-                        "last_status_time": now
-                    }
-                    
-                    # Update metadata
-                    if user_id != "anonymous":
-                        if user_id not in USER_DATA: USER_DATA[user_id] = {}
-                        USER_DATA[user_id].update({
-                            "nickname": nick,
-                            "tripcode": tripcode
-                        })
-                        save_user_data()
-                    
-                    # Auto-remove lobby if player is no longer in-game
-                    if not in_game and websocket in LOBBIES:
-                        logging.info(f"Removing lobby for {nick} - game exited.")
-                        del LOBBIES[websocket]
-                        await broadcast_lobby_list()
-
-                    await broadcast_player_list()
-
-                elif data.get("type") == "chat":
-                    msg_text = data.get("message", "")
-                    nick = data.get("nickname", "Unknown")
-                    
-                    if first_message:
-                        first_message = False
-                    
-                    # 1. Length Limit
-                    if len(msg_text) > MAX_MESSAGE_LENGTH:
-                        msg_text = msg_text[:MAX_MESSAGE_LENGTH]
-                    
-                    # 2. Rate Limiting
-                    now = time.time()
-                    last_time = IP_LAST_MESSAGE_TIME.get(ip, 0)
-                    if now - last_time < RATE_LIMIT_SECONDS:
+                data = decode_message(message)
+                if not isinstance(data, dict):
+                    continue
+                msg_type = data.get("type")
+                if not isinstance(msg_type, str) or msg_type not in MESSAGE_HANDLERS:
+                    msg_type = "unknown"
+                MESSAGES_IN[msg_type] = MESSAGES_IN.get(msg_type, 0) + 1
+                if msg_type == "unknown":
+                    continue
+                handler, validate = MESSAGE_HANDLERS[msg_type]
+                bad_field = validate(data)
+                if bad_field:
+                    METRICS["messages_rejected"] += 1
+                    logging.warning(f"Rejected {msg_type} from {ip}: invalid '{bad_field}'")
+                    continue
+                if msg_type in RATE_LIMITS:
+                    user_id = data.get("user_id") or CLIENTS[websocket].get("user_id", "anonymous")
+                    keys = ("ip:" + ip,) if user_id == "anonymous" else ("ip:" + ip, "user:" + user_id)
+                    if not allow_message(msg_type, *keys):
+                        METRICS["messages_rate_limited"] += 1
                         continue # Ignore spam
-                    
-                    IP_LAST_MESSAGE_TIME[ip] = now
-                    
-                    # Refresh metadata on every message to ensure player list is accurate
-                    color = get_nickname_color(nick)
-                    user_id = data.get("user_id", "anonymous")
-                    tripcode = hashlib.sha256(user_id.encode()).hexdigest()[:4]
-                    
-                    # Update metadata but KEEP tracking info
-                    now = time.time()
-                    old_meta = CLIENTS[websocket]
-                    # Update playtime on chat as well
-                    if old_meta.get("in_game") and "last_status_time" in old_meta:
-                        delta = now - old_meta["last_status_time"]
-                        uid = old_meta.get("user_id", "anonymous")
-                        if uid != "anonymous":
-                            if uid not in USER_DATA: USER_DATA[uid] = {}
-                            USER_DATA[uid]["playtime"] = USER_DATA[uid].get("playtime", 0) + delta
-                            save_user_data()
-
-                    CLIENTS[websocket] = {
-                        "nickname": nick, 
-                        "modpack": data.get("modpack", old_meta["modpack"]), 
-                        "in_game": data.get("in_game", old_meta["in_game"]), 
-                        "game_mode": data.get("game_mode", old_meta["game_mode"]), 
-                        "color": color,
-                        "tripcode": tripcode,
-                        "user_id": user_id,
-                        "last_status_time": now
-                    }
-                    
-                    # Generate Tripcode if user_id is provided
-                    tripcode = hashlib.sha256(user_id.encode()).hexdigest()[:4]
-                    
-                    # Store in history
-                    chat_entry = {
-                        "nickname": nick, 
-                        "message": msg_text, 
-                        "time": time.strftime("%H:%M"),
-                        "color": color,
-                        "tripcode": tripcode
-                    }
-                    CHAT_HISTORY.append(chat_entry)
-                    if len(CHAT_HISTORY) > MAX_HISTORY:
-                        CHAT_HISTORY.pop(0)
-                    
-                    # Persistent Save
-                    save_chat_history()
-                        
-                    # Broadcast to all
-                    await broadcast(json.dumps({"type": "chat", **chat_entry}, ensure_ascii=False))
-
-                elif data.get("type") == "request_history":
-                    # Send history to the requester only
-                    if CHAT_HISTORY:
-                        history_payload = json.dumps({"type": "history", "messages": CHAT_HISTORY}, ensure_ascii=False)
-                        await websocket.send(history_payload)
-                    
-                elif data.get("type") == "request_player_list":
-                    # Send player list to the requester only
-                    players = []
-                    for meta in CLIENTS.values():
-                        uid = meta.get("user_id", "anonymous")
-                        user_info = USER_DATA.get(uid, {})
-                        total_seconds = user_info.get("playtime", 0)
-                        
-                        if total_seconds < 60: playtime_str = f"{int(total_seconds)}s"
-                        elif total_seconds < 3600: playtime_str = f"{int(total_seconds // 60)}m"
-                        else: playtime_str = f"{total_seconds / 3600:.1f}h"
-
-                        players.append({
-                            "nickname": meta["nickname"],
-                            "modpack": meta["modpack"],
-                            "in_game": meta.get("in_game", False),
-                            "game_mode": meta.get("game_mode", "Online"),
-                            "color": meta["color"],
-                            "tripcode": meta.get("tripcode", ""),
-                            "playtime": playtime_str
-                        })
-                    await websocket.send(json.dumps({"type": "player_list", "players": players}, ensure_ascii=False))
-                
-                elif data.get("type") == "host_lobby":
-                    password = data.get("password", "")
-                    if password:
-                        meta = CLIENTS.get(websocket, {})
-                        LOBBIES[websocket] = {
-                            "password": password,
-                            "nickname": meta.get("nickname", "Unknown"),
-                            "color": meta.get("color", "gray")
-                        }
-                        logging.info(f"Lobby hosted by {LOBBIES[websocket]['nickname']} with pass: {password}")
-                        await broadcast_lobby_list()
-
-                elif data.get("type") == "request_lobbies":
-                    await broadcast_lobby_list()
-
-                elif data.get("type") == "request_leaderboard":
-                    logging.info(f"Leaderboard requested. USER_DATA has {len(USER_DATA)} entries.")
-                    # Sort by playtime descending
-                    leaderboard_candidates = []
-                    for uid, info in USER_DATA.items():
-                        # Robust check: info MUST be a dict
-                        if isinstance(info, dict) and info.get("playtime", 0) >= 0:
-                            leaderboard_candidates.append((uid, info.get("playtime", 0)))
-                    
-                    logging.info(f"Found {len(leaderboard_candidates)} valid leaderboard candidates.")
-                    sorted_playtime = sorted(leaderboard_candidates, key=lambda x: x[1], reverse=True)[:50]
-                    leaderboard = []
-                    for uid, total_seconds in sorted_playtime:
-                        info = USER_DATA.get(uid, {})
-                        if not isinstance(info, dict): info = {}
-                        
-                        if total_seconds < 60: playtime_str = f"{int(total_seconds)}s"
-                        elif total_seconds < 3600: playtime_str = f"{int(total_seconds // 60)}m"
-                        else: playtime_str = f"{total_seconds / 3600:.1f}h"
-                        
-                        leaderboard.append({
-                            "nickname": info.get("nickname", "Anonymous"),
-                            "tripcode": info.get("tripcode", "????"),
-                            "playtime": playtime_str,
-                            "playtime_seconds": total_seconds
-                        })
-                    logging.info(f"Sending leaderboard with {len(leaderboard)} entries.")
-                    await websocket.send(json.dumps({"type": "leaderboard", "entries": leaderboard}, ensure_ascii=False))
+                cpu[0] += time.thread_time() - cpu_started
+                cpu_started = None
+                await cpu_timed(handler(websocket, data), cpu)
 
             except json.JSONDecodeError:
                 logging.warning(f"Invalid JSON received from {ip}")
+            finally:
+                if cpu_started is not None:
+                    cpu[0] += time.thread_time() - cpu_started
+                record_handler_cpu(msg_type, cpu[0])
     except websockets.exceptions.ConnectionClosed:
         logging.info(f"Client disconnected: {ip}")
     finally:
+        lobby_removed = set_lobby(websocket, None)
         if websocket in CLIENTS:
             meta = CLIENTS[websocket]
             # Final playtime capture on disconnect
-            if meta.get("in_game") and "last_status_time" in meta:
-                now = time.time()
-                delta = now - meta["last_status_time"]
-                uid = meta.get("user_id", "anonymous")
-                if uid != "anonymous":
-                    if uid not in USER_DATA: USER_DATA[uid] = {}
-                    USER_DATA[uid]["playtime"] = USER_DATA[uid].get("playtime", 0) + delta
-                    save_user_data()
+            credit_playtime(meta, time.time())
+            release_client_color(meta)
+            if meta.get("outbox_task"):
+                meta["outbox_task"].cancel()
             del CLIENTS[websocket]
-            
-        if websocket in LOBBIES:
-            del LOBBIES[websocket]
-            await broadcast_lobby_list()
-            
+        PLAYERS_BY_PID.pop(pid, None)
+
         # Broadcast updated user count and list
-        await broadcast(json.dumps({"type": "user_count", "count": len(CLIENTS)}, ensure_ascii=False))
-        await broadcast_player_list()
+        schedule_roster_update([pid], lobbies=lobby_removed, count=True)
 
-# Load data on module load
-load_chat_history()
-load_user_data()
+# Load data on module load (workers get theirs from the broker, see apply_sync)
+if not IS_WORKER:
+    load_chat_history()
+    load_user_data()
+    seed_leaderboard()
 
 async def main():
-    # Use 0.0.0.0 to allow external connections, port 8765
+    global USER_DATA_FLUSH_EVENT, ROSTER_FLUSH_HANDLE
+    ROSTER_FLUSH_HANDLE = None # A handle from a previous (crashed) loop is dead
+    METRICS["roster_coalesce_window_ms"] = ROSTER_COALESCE_WINDOW * 1000
+    USER_DATA_FLUSH_EVENT = asyncio.Event()
+    flush_task = asyncio.create_task(user_data_flush_loop())
+    background_tasks = [asyncio.create_task(loop_lag_monitor()), asyncio.create_task(slow_client_monitor())]
+    if METRICS_DUMP_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(metrics_dump_loop()))
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_port = METRICS_PORT + 1 + WORKER_INDEX if IS_WORKER else METRICS_PORT
+        metrics_server = await asyncio.start_server(handle_metrics_request, METRICS_HOST, metrics_port)
+        logging.info(f"Metrics available on http://{METRICS_HOST}:{metrics_port}/metrics")
+
+    # Resolve on SIGTERM so the final flush below runs (not available on Windows)
+    stop = asyncio.get_running_loop().create_future()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set_result, None)
+    except (NotImplementedError, AttributeError):
+        pass
+
+    # Use 0.0.0.0 to allow external connections, port 8765 by default
+    bus_task = None
     try:
-        async with websockets.serve(handle_client, "0.0.0.0", 8765):
-            logging.info("WebSocket server started on ws://0.0.0.0:8765")
-            await asyncio.Future()  # run forever
+        if SERVER_ROLE == "broker":
+            await run_broker(stop)
+        else:
+            if IS_WORKER:
+                bus_task = await connect_bus(stop)
+            # Workers share the port; the kernel spreads new connections across them
+            async with websockets.serve(handle_client, SERVER_HOST, SERVER_PORT, reuse_port=IS_WORKER,
+                                        compression="deflate" if WS_COMPRESSION == "deflate" else None):
+                logging.info(f"WebSocket server started on ws://{SERVER_HOST}:{SERVER_PORT}")
+                await stop  # run until SIGTERM
     except Exception as e:
         logging.error(f"Fatal server error: {e}")
         raise e
+    finally:
+        flush_task.cancel()
+        for task in background_tasks:
+            task.cancel()
+        if metrics_server:
+            metrics_server.close()
+        if bus_task:
+            bus_task.cancel()
+        _close_chat_journal()
+        # Guaranteed final flush of anything still dirty
+        if USER_DATA_DIRTY:
+            save_user_data()
+            logging.info(f"Final user data flush: {METRICS['user_data_bytes_written']} bytes written in {METRICS['user_data_flushes']} flushes.")
 
 if __name__ == "__main__":
     while True:
         try:
             asyncio.run(main())
+            logging.info("Server stopped.")
+            break
         except KeyboardInterrupt:
             logging.info("Server stopped by user.")
             break
         except Exception as e:
             if "10048" in str(e) or "Address already in use" in str(e):
-                logging.error(f"Port 8765 is already in use. Retrying in 10s... {e}")
+                logging.error(f"Port {SERVER_PORT} is already in use. Retrying in 10s... {e}")
                 time.sleep(10)
             else:
                 logging.error(f"Server crashed, restarting in 2s: {e}")
@@ -0,0 +1,46 @@
+import asyncio
+import json
+import time
+
+
+def test_worker_gets_shared_state_from_the_broker(load_server, tmp_path):
+    with open(tmp_path / "user_data.json", "w", encoding="utf-8") as f:
+        json.dump({"u1": {"playtime": 100, "nickname": "One", "tripcode": "1111"}}, f)
+    bus_path = str(tmp_path / "bus.sock")
+    broker = load_server(ER_SERVER_WORKERS=2, ER_SERVER_ROLE="broker", ER_BUS_PATH=bus_path)
+    # Changes the worker could miss if it read the files itself: a flushed one and a dirty one
+    broker.add_playtime("u2", 500)
+    broker.update_user_metadata("u2", "Two", "2222")
+    asyncio.run(broker.flush_user_data())
+    broker.add_playtime("u1", 1000)
+    broker.append_chat_history({"id": 1, "nickname": "One", "message": "hi", "time": "10:00"})
+
+    worker = load_server(ER_SERVER_WORKERS=2, ER_SERVER_ROLE="worker", ER_WORKER_INDEX=1, ER_BUS_PATH=bus_path)
+    assert not worker.USER_DATA and not worker.LEADERBOARD_TOP and not worker.CHAT_HISTORY
+
+    async def run():
+        bus_server = await asyncio.start_unix_server(broker.handle_bus_worker, path=bus_path)
+        stop = asyncio.get_running_loop().create_future()
+        pump = await worker.connect_bus(stop)
+        # Synced before connect_bus returns, i.e. before the worker accepts clients
+        assert worker.LEADERBOARD_TOP == broker.LEADERBOARD_TOP
+        assert worker.LEADERBOARD_TOP["u1"]["playtime"] == 1100
+        assert worker.LEADERBOARD_TOP["u2"] == {"nickname": "Two", "tripcode": "2222", "playtime": 500}
+        assert list(worker.CHAT_HISTORY) == list(broker.CHAT_HISTORY)
+
+        # Playtime credited on the worker is applied by the broker and relayed back
+        worker.credit_playtime({"in_game": True, "user_id": "u2", "last_status_time": time.time() - 60}, time.time())
+        worker.update_user_metadata("u2", "Two again", "2222")
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if worker.USER_DATA.get("u2", {}).get("nickname") == "Two again":
+                break
+        assert round(broker.USER_DATA["u2"]["playtime"]) == 560
+        assert worker.USER_DATA["u2"] == broker.USER_DATA["u2"]
+        assert worker.LEADERBOARD_TOP == broker.LEADERBOARD_TOP
+
+        pump.cancel()
+        worker.BUS.close()
+        bus_server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+import json
+
+
+def entry(i):
+    return {"nickname": "a", "message": f"msg {i}", "time": "10:00", "color": "gray", "tripcode": "ab12"}
+
+
+def write_journal(path, entries, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e) + "\n")
+        f.write(tail)
+
+
+def read_journal(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_torn_last_line_is_skipped(load_server, tmp_path):
+    # A crash in the middle of an append leaves half a JSON line at the end
+    write_journal(tmp_path / "chat_log.jsonl", [entry(i) for i in range(3)], tail='{"nickname": "a", "mess')
+    server = load_server()
+    assert list(server.CHAT_HISTORY) == [entry(i) for i in range(3)]
+    # The startup compaction drops the torn line, so new appends start on a clean line
+    server.append_chat_history(entry(3))
+    assert read_journal(server.LOG_FILE) == [entry(i) for i in range(4)]
+
+
+def test_startup_loads_only_the_last_entries(load_server, tmp_path):
+    write_journal(tmp_path / "chat_log.jsonl", [entry(i) for i in range(250)])
+    server = load_server()
+    assert list(server.CHAT_HISTORY) == [entry(i) for i in range(150, 250)]
+    assert read_journal(server.LOG_FILE) == [entry(i) for i in range(150, 250)]
+
+
+def test_compaction_keeps_the_last_entries(load_server):
+    server = load_server(ER_CHAT_JOURNAL_COMPACT_LINES=120)
+    for i in range(150):
+        server.append_chat_history(entry(i))
+        assert server.CHAT_JOURNAL_LINES < 120
+    journal = read_journal(server.LOG_FILE)
+    # Compacted at 120 lines down to the ring, then appended to again
+    assert len(journal) == server.CHAT_JOURNAL_LINES == 110
+    assert journal == [entry(i) for i in range(40, 150)]
+
+    server._close_chat_journal()
+    restarted = load_server()
+    assert list(restarted.CHAT_HISTORY) == [entry(i) for i in range(50, 150)]
+
+
+def test_old_json_history_is_migrated(load_server, tmp_path):
+    with open(tmp_path / "chat_log.json", "w", encoding="utf-8") as f:
+        json.dump([entry(i) for i in range(120)], f)
+    server = load_server()
+    assert list(server.CHAT_HISTORY) == [entry(i) for i in range(20, 120)]
+    assert read_journal(server.LOG_FILE) == [entry(i) for i in range(20, 120)]
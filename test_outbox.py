@@ -0,0 +1,67 @@
+import asyncio
+
+
+class StalledSocket:
+    """Websocket whose sends complete only when the test grants credit."""
+
+    def __init__(self):
+        self.sent = []
+        self.credit = asyncio.Semaphore(0)
+        self.aborted = False
+        self.transport = self
+
+    async def send(self, frame, text=False):
+        await self.credit.acquire()
+        self.sent.append(frame)
+
+    def abort(self):
+        self.aborted = True
+
+
+def fill_past_cap(server, websocket):
+    server.CLIENTS[websocket] = {"nickname": "slow"}
+    for _ in range(12):
+        server.enqueue_frame(websocket, b"x" * 100)
+    meta = server.CLIENTS[websocket]
+    assert meta["outbox_bytes"] == 1000
+    assert server.METRICS["outbox_frames_dropped"] == 2
+    assert meta["over_limit_since"] is not None
+    return meta
+
+
+def test_client_that_recovered_from_the_cap_is_not_evicted(load_server):
+    server = load_server(ER_OUTBOX_MAX_BYTES=1000, ER_SLOW_CLIENT_TIMEOUT=0.5)
+
+    async def run():
+        websocket = StalledSocket()
+        meta = fill_past_cap(server, websocket)
+        monitor = asyncio.create_task(server.slow_client_monitor())
+        # Drains partway and then keeps a backlog, with nothing dropped since
+        for _ in range(3):
+            websocket.credit.release()
+        await asyncio.sleep(0.05)
+        assert meta["outbox_bytes"] == 700
+        assert meta["over_limit_since"] is None
+        await asyncio.sleep(2.2)
+        assert not websocket.aborted
+        assert websocket in server.SLOW_CLIENTS
+        monitor.cancel()
+        meta["outbox_task"].cancel()
+
+    asyncio.run(run())
+
+
+def test_stalled_client_is_evicted(load_server):
+    server = load_server(ER_OUTBOX_MAX_BYTES=1000, ER_SLOW_CLIENT_TIMEOUT=0.5)
+
+    async def run():
+        websocket = StalledSocket()
+        meta = fill_past_cap(server, websocket)
+        monitor = asyncio.create_task(server.slow_client_monitor())
+        await asyncio.sleep(2.2)
+        assert websocket.aborted
+        assert server.METRICS["slow_clients_disconnected"] == 1
+        monitor.cancel()
+        meta["outbox_task"].cancel()
+
+    asyncio.run(run())
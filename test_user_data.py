@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_user_file(server):
+    with open(server.USER_DATA_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_changes_stay_in_memory_until_flushed(load_server):
+    server = load_server()
+    server.add_playtime("u1", 30)
+    server.update_user_metadata("u1", "Tarnished", "ab12")
+    assert server.USER_DATA_DIRTY == {"u1"}
+    assert not os.path.exists(server.USER_DATA_FILE)
+
+    asyncio.run(server.flush_user_data())
+    assert not server.USER_DATA_DIRTY
+    assert read_user_file(server) == {"u1": {"playtime": 30, "nickname": "Tarnished", "tripcode": "ab12"}}
+
+
+def test_dirty_threshold_wakes_the_flush_loop(load_server):
+    server = load_server(ER_USER_DATA_FLUSH_THRESHOLD=2)
+
+    async def run():
+        server.USER_DATA_FLUSH_EVENT = asyncio.Event()
+        server.add_playtime("u1", 1)
+        assert not server.USER_DATA_FLUSH_EVENT.is_set()
+        server.add_playtime("u2", 1)
+        assert server.USER_DATA_FLUSH_EVENT.is_set()
+
+    asyncio.run(run())
+
+
+def test_dirty_users_are_flushed_on_shutdown(load_server, monkeypatch):
+    # Long interval: only the final flush in main() can write the file
+    server = load_server(ER_SERVER_HOST="127.0.0.1", ER_SERVER_PORT=free_port(),
+                         ER_USER_DATA_FLUSH_INTERVAL=3600)
+
+    async def run():
+        main = asyncio.create_task(server.main())
+        await asyncio.sleep(0.2)
+        server.add_playtime("u1", 42)
+        server.update_user_metadata("u1", "Tarnished", "ab12")
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(main, 5)
+
+    asyncio.run(run())
+    assert not server.USER_DATA_DIRTY
+    restarted = load_server()
+    assert restarted.USER_DATA["u1"] == {"playtime": 42, "nickname": "Tarnished", "tripcode": "ab12"}
+    assert restarted.LEADERBOARD_TOP["u1"]["playtime"] == 42
+
+
+def test_sqlite_store_round_trip(load_server):
+    server = load_server(ER_USER_STORE="sqlite")
+    for i in range(60):
+        server.add_playtime(f"u{i}", i * 10)
+    server.update_user_metadata("u59", "Tarnished", "ab12")
+    asyncio.run(server.flush_user_data())
+    server.evict_clean_users()
+    assert not server.USER_DATA
+    assert server.get_user("u59") == {"playtime": 590, "nickname": "Tarnished", "tripcode": "ab12"}
+
+    server.USER_DB.close()
+    restarted = load_server(ER_USER_STORE="sqlite")
+    assert restarted.get_user("u3") == {"playtime": 30}
+    top = restarted.top_playtime(5)
+    assert [uid for uid, _ in top] == ["u59", "u58", "u57", "u56", "u55"]
+    assert len(restarted.LEADERBOARD_TOP) == restarted.LEADERBOARD_SIZE
+    assert restarted.LEADERBOARD_FLOOR == 100
+    # Unflushed changes win over the stored rows in the leaderboard query
+    restarted.add_playtime("u0", 1000)
+    assert restarted.top_playtime(1)[0][0] == "u0"
+
+
+def test_legacy_json_is_imported_into_sqlite(load_server, tmp_path):
+    legacy = {
+        "user_data.json": {"u1": {"playtime": 100, "nickname": "One", "tripcode": "1111"}},
+        "playtime.json": {"u1": 5, "u2": 200},
+        "user_metadata.json": {"u2": {"nickname": "Two", "tripcode": "2222"}},
+    }
+    for name, data in legacy.items():
+        with open(tmp_path / name, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    server = load_server(ER_USER_STORE="sqlite")
+    assert not server.USER_DATA # Rows are loaded on demand
+    assert server.get_user("u1") == {"playtime": 105, "nickname": "One", "tripcode": "1111"}
+    assert server.get_user("u2") == {"playtime": 200, "nickname": "Two", "tripcode": "2222"}
+    assert [uid for uid, _ in server.top_playtime()] == ["u2", "u1"]
+    # The JSON files are left untouched, and a non-empty database isn't imported into again
+    for name, data in legacy.items():
+        with open(tmp_path / name, encoding="utf-8") as f:
+            assert json.load(f) == data
+    server.add_playtime("u1", 1)
+    asyncio.run(server.flush_user_data())
+    server.USER_DB.close()
+    restarted = load_server(ER_USER_STORE="sqlite")
+    assert restarted.get_user("u1")["playtime"] == 106